@@ -0,0 +1,147 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from typing import Optional
+import hashlib
+import os
+import orjson
+from backend.core.utils import get_db
+from backend.core.admission import annotate_rate_limited_user
+from backend.core.responses import RecordResponse
+from backend.sessions.sessions import TokenOut
+from backend.core.maintenance import decompress_messages
+from backend.annotate.refresh import reannotate
+from backend.references.sentence_parser import annotation_version, build_token_metadata_batch
+
+# Max texts + message ids per request
+MAX_BATCH = int(os.getenv("ANNOTATE_MAX_BATCH", "100"))
+# Max characters per text, and across all texts in a request
+MAX_TEXT_CHARS = int(os.getenv("ANNOTATE_MAX_TEXT_CHARS", "4000"))
+MAX_TOTAL_CHARS = int(os.getenv("ANNOTATE_MAX_TOTAL_CHARS", "50000"))
+
+router = APIRouter()
+
+class AnnotateRequest(BaseModel):
+    texts: list[str] = []
+    message_ids: list[int] = []
+    # Slang glossary used for `texts`; stored messages use their session's dialect
+    dialect: Optional[str] = None
+
+class TextAnnotation(BaseModel):
+    text: str
+    tokens: list[TokenOut]
+
+class MessageAnnotation(BaseModel):
+    id: int
+    tokens: list[TokenOut]
+
+class AnnotateResponse(BaseModel):
+    version: str
+    texts: list[TextAnnotation]
+    messages: list[MessageAnnotation]
+    # Requested message ids that don't exist or belong to another user
+    missing: list[int] = []
+
+def request_etag(version: str, payload: AnnotateRequest) -> str:
+    # Weak: CompressionMiddleware may send this body gzip, brotli or plain under the same tag
+    key = orjson.dumps([version, payload.dialect, payload.texts, payload.message_ids])
+    return f'W/"{version}-{hashlib.sha1(key).hexdigest()[:16]}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match list (or *) against our ETag"""
+    if not if_none_match:
+        return False
+    opaque = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == opaque:
+            return True
+    return False
+
+async def annotate_messages(db, message_ids: list[int], user_id: int, version: str) -> tuple[list[dict], list[int]]:
+    """
+    Token metadata for the user's stored messages, hot or archived. Rows annotated
+    under an older version (or never, like user messages) are re-annotated and
+    written back. Also returns the ids that don't exist or aren't the user's.
+    """
+    rows = await db.fetch(
+        """
+        SELECT m.id, m.created_at, m.content, m.token_metadata, m.token_metadata_version, s.dialect
+        FROM messages m
+        JOIN sessions s ON s.id = m.session_id
+        WHERE m.id = ANY($1::int[]) AND s.user_id = $2
+        """,
+        message_ids, user_id
+    )
+    hot = [dict(r) for r in rows]
+    found = {m["id"]: m for m in hot}
+
+    # Anything not in the hot table may have been moved to cold storage
+    wanted = set(message_ids)
+    batches = []
+    missing = [i for i in wanted if i not in found]
+    if missing:
+        archives = await db.fetch(
+            """
+            SELECT a.id, a.payload, s.dialect
+            FROM message_archives a
+            JOIN sessions s ON s.id = a.session_id
+            WHERE s.user_id = $2
+              AND (a.min_message_id IS NULL OR EXISTS (
+                  SELECT 1 FROM unnest($1::int[]) AS i
+                  WHERE i BETWEEN a.min_message_id AND a.max_message_id
+              ))
+            """,
+            missing, user_id
+        )
+        for a in archives:
+            messages = decompress_messages(a["payload"])
+            batches.append((a["id"], a["dialect"], messages))
+            for m in messages:
+                if m["id"] in wanted:
+                    found.setdefault(m["id"], m)
+
+    await reannotate(db, version, hot, batches, only=wanted)
+
+    ids = list(dict.fromkeys(message_ids))
+    return (
+        [{"id": i, "tokens": found[i]["token_metadata"]} for i in ids if i in found],
+        [i for i in ids if i not in found],
+    )
+
+@router.post("/", summary="Token metadata for a batch of texts or stored messages", response_model=AnnotateResponse)
+async def annotate(
+    payload: AnnotateRequest,
+    request: Request,
+    current_user: dict = Depends(annotate_rate_limited_user)
+):
+    if not payload.texts and not payload.message_ids:
+        raise HTTPException(status_code=400, detail="texts or message_ids required")
+    if len(payload.texts) + len(payload.message_ids) > MAX_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH} texts and message ids per request")
+    if any(len(t) > MAX_TEXT_CHARS for t in payload.texts):
+        raise HTTPException(status_code=413, detail=f"Each text must be at most {MAX_TEXT_CHARS} characters")
+    if sum(len(t) for t in payload.texts) > MAX_TOTAL_CHARS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_TOTAL_CHARS} characters of text per request")
+
+    # Annotations only change with the dictionary/glossary/model version, so a
+    # client holding this ETag can skip the work entirely
+    version = annotation_version()
+    etag = request_etag(version, payload)
+    headers = {"ETag": etag, "X-Annotation-Version": version}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    texts = []
+    if payload.texts:
+        annotated = await run_in_threadpool(build_token_metadata_batch, payload.texts, payload.dialect)
+        texts = [{"text": t, "tokens": tokens} for t, tokens in zip(payload.texts, annotated)]
+
+    messages, missing = [], []
+    if payload.message_ids:
+        messages, missing = await annotate_messages(get_db(request), payload.message_ids, current_user["id"], version)
+
+    return RecordResponse(
+        {"version": version, "texts": texts, "messages": messages, "missing": missing},
+        headers=headers,
+    )
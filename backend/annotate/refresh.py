@@ -0,0 +1,52 @@
+from itertools import groupby
+from starlette.concurrency import run_in_threadpool
+from backend.core.maintenance import rewrite_archive
+from backend.references.sentence_parser import build_token_metadata_batch
+
+
+def is_current(message, version: str) -> bool:
+    return message["token_metadata_version"] == version and message["token_metadata"] is not None
+
+
+async def reannotate(db, version: str, hot=(), batches=(), only=None):
+    """
+    Re-annotate stored messages whose token_metadata isn't from `version`,
+    updating the dicts in place and writing them back. `hot` are dicts of
+    messages rows with a "dialect" key; `batches` are (archive id, dialect,
+    messages) for cold storage. With `only`, just those message ids count.
+    """
+    stale_hot = [
+        m for m in hot
+        if (only is None or m["id"] in only) and not is_current(m, version)
+    ]
+    targets = [(m, m["dialect"]) for m in stale_hot]  # (message, dialect)
+    dirty = []
+    for archive_id, dialect, messages in batches:
+        stale = [
+            m for m in messages
+            if (only is None or m["id"] in only) and not is_current(m, version)
+        ]
+        targets.extend((m, dialect) for m in stale)
+        if stale:
+            dirty.append((archive_id, messages))
+    if not targets:
+        return
+
+    targets.sort(key=lambda t: t[1] or "")
+    for dialect, group in groupby(targets, key=lambda t: t[1]):
+        group = [m for m, _ in group]
+        annotated = await run_in_threadpool(build_token_metadata_batch, [m["content"] for m in group], dialect)
+        for m, tokens in zip(group, annotated):
+            m["token_metadata"] = tokens
+            m["token_metadata_version"] = version
+
+    if stale_hot:
+        await db.executemany(
+            """
+            UPDATE messages SET token_metadata = $1, token_metadata_version = $2
+            WHERE id = $3 AND created_at = $4
+            """,
+            [(m["token_metadata"], version, m["id"], m["created_at"]) for m in stale_hot]
+        )
+    for archive_id, messages in dirty:
+        await rewrite_archive(db, archive_id, messages)
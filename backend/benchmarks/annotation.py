@@ -0,0 +1,262 @@
+"""
+Offline benchmark for the NLP annotation hot path (no network, no database).
+
+Measures load_dictionary() cold time, dictionary() and build_token_metadata()
+latency percentiles and throughput per reply length, the batched
+build_token_metadata_batch() throughput, and peak memory, over the bundled
+synthetic chat corpus in data/chat_corpus.json.
+
+Run from the repo root:
+    python -m backend.benchmarks.annotation --output results.json
+    python -m backend.benchmarks.annotation --baseline results.json --threshold 0.15
+
+Every metric is the median over --runs runs, and "spread" records how far
+the runs disagreed. With --baseline the run exits non-zero if any latency
+grows, or any throughput drops, by more than the threshold relative to the
+baseline, and by more than the spread of either side, so a noisy machine
+widens the limit instead of failing the same code. import_ms (mostly the
+spaCy model load) is reported but never compared.
+
+The suite fails if en_es_aidict.json could not be loaded, since it would
+otherwise time the empty-dictionary fallback; pass --allow-missing-dictionary
+to run anyway.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "data", "chat_corpus.json")
+LENGTHS = ("short", "medium", "long")
+
+
+def load_corpus(path: str = CORPUS_PATH) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize(samples_ms: list[float], items: int) -> dict:
+    total_s = sum(samples_ms) / 1000
+    return {
+        "p50_ms": round(percentile(samples_ms, 50), 4),
+        "p95_ms": round(percentile(samples_ms, 95), 4),
+        "p99_ms": round(percentile(samples_ms, 99), 4),
+        "mean_ms": round(statistics.fmean(samples_ms), 4),
+        "throughput_per_s": round(items / total_s, 2) if total_s else None,
+    }
+
+
+def time_each(fn, entries: list[dict], repeat: int) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        for entry in entries:
+            start = time.perf_counter()
+            fn(entry["text"], entry["dialect"])
+            samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def bench_load_dictionary(sentence_parser) -> float:
+    # Reset module state so the load is cold, as on a fresh worker
+    sentence_parser.SPANISH_DICT = {}
+    sentence_parser.DICT_LOADED = False
+    start = time.perf_counter()
+    sentence_parser.load_dictionary()
+    return round((time.perf_counter() - start) * 1000, 3)
+
+
+# Never compared against a baseline: import_ms is dominated by loading the spaCy
+# model from disk, the others are counts rather than measurements
+UNCOMPARED = ("import_ms", "dictionary_entries", "batch_size")
+
+
+def run(sentence_parser, corpus: list[dict], repeat: int, batch_size: int) -> dict:
+    results = {
+        "load_dictionary_cold_ms": bench_load_dictionary(sentence_parser),
+        "dictionary_entries": len(sentence_parser.SPANISH_DICT),
+    }
+
+    # Warm up the pipeline before timing anything
+    for entry in corpus[:10]:
+        sentence_parser.build_token_metadata(entry["text"], entry["dialect"])
+    gc.collect()
+
+    for name, fn in (
+        ("dictionary", sentence_parser.dictionary),
+        ("build_token_metadata", sentence_parser.build_token_metadata),
+    ):
+        results[name] = {}
+        for length in LENGTHS:
+            entries = [e for e in corpus if e["length"] == length]
+            results[name][length] = summarize(time_each(fn, entries, repeat), len(entries) * repeat)
+        results[name]["all"] = summarize(time_each(fn, corpus, 1), len(corpus))
+
+    by_dialect = {}
+    for entry in corpus:
+        by_dialect.setdefault(entry["dialect"], []).append(entry["text"])
+    samples = []
+    for _ in range(repeat):
+        for dialect, texts in by_dialect.items():
+            for i in range(0, len(texts), batch_size):
+                start = time.perf_counter()
+                sentence_parser.build_token_metadata_batch(texts[i:i + batch_size], dialect)
+                samples.append((time.perf_counter() - start) * 1000)
+    batch = summarize(samples, len(corpus) * repeat)
+    batch["batch_size"] = batch_size
+    results["build_token_metadata_batch"] = batch
+
+    # Separate untimed pass, since tracing allocations slows everything down
+    gc.collect()
+    tracemalloc.start()
+    bench_load_dictionary(sentence_parser)
+    for dialect, texts in by_dialect.items():
+        sentence_parser.build_token_metadata_batch(texts, dialect)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results["memory"] = {
+        # Python allocations while cold-loading the dictionary and annotating the corpus
+        "python_peak_mb": round(peak / 2**20, 2),
+        # ru_maxrss is KiB on Linux and bytes on macOS
+        "max_rss_mb": round(maxrss / (2**20 if sys.platform == "darwin" else 2**10), 2),
+    }
+    return results
+
+
+def merge_runs(runs: list[dict], reduce) -> dict:
+    """Combine several run() results metric by metric with reduce(list of values)"""
+    merged = {}
+    for key, value in runs[0].items():
+        if isinstance(value, dict):
+            merged[key] = merge_runs([r[key] for r in runs], reduce)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            merged[key] = round(reduce([r[key] for r in runs]), 4)
+    return merged
+
+
+def relative_spread(values: list[float]) -> float:
+    mid = statistics.median(values)
+    return (max(values) - min(values)) / mid if mid else 0.0
+
+
+def metrics(results: dict, prefix: str = ""):
+    """Flatten results into (path, value) pairs for the comparable numeric metrics"""
+    for key, value in results.items():
+        if key in ("meta", "spread"):
+            continue
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from metrics(value, f"{path}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, value
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta_ms: float = 0.5) -> list[str]:
+    """
+    Return a description of every metric that regressed past the threshold.
+    Timings that moved by less than min_delta_ms are treated as noise, as are
+    changes within the run-to-run spread either side measured for that metric.
+    """
+    base = dict(metrics(baseline))
+    noise = dict(metrics(baseline.get("spread", {})))
+    noise.update((path, max(spread, noise.get(path, 0))) for path, spread in metrics(results.get("spread", {})))
+    regressions = []
+    for path, value in metrics(results):
+        old = base.get(path)
+        if not old or path.endswith(UNCOMPARED):
+            continue
+        if path.endswith("_ms") and abs(value - old) < min_delta_ms:
+            continue
+        if path.endswith("throughput_per_s"):
+            change = (old - value) / old
+        else:
+            change = (value - old) / old
+        limit = max(threshold, noise.get(path, 0))
+        if change > limit:
+            regressions.append(f"{path}: {old} -> {value} ({change:+.1%} worse, limit {limit:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--repeat", type=int, default=3, help="passes over each length bucket per run")
+    parser.add_argument("--runs", type=int, default=5, help="independent runs; each metric is their median")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--baseline", help="results JSON from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("BENCH_REGRESSION_THRESHOLD", "0.2")),
+                        help="allowed relative regression, e.g. 0.2 for 20%%")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5,
+                        help="ignore timing changes smaller than this many milliseconds")
+    parser.add_argument("--allow-missing-dictionary", action="store_true",
+                        help="run even if en_es_aidict.json didn't load")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    start = time.perf_counter()
+    from backend.references import sentence_parser
+    import_ms = (time.perf_counter() - start) * 1000
+
+    runs = [run(sentence_parser, corpus, args.repeat, args.batch_size) for _ in range(args.runs)]
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "model": f"{sentence_parser.es_nlp.meta.get('name')}-{sentence_parser.es_nlp.meta.get('version')}",
+            "annotation_version": sentence_parser.annotation_version(),
+            "dictionary_loaded": bool(sentence_parser.SPANISH_DICT),
+            "corpus_size": len(corpus),
+            "repeat": args.repeat,
+            "runs": args.runs,
+        },
+        "import_ms": round(import_ms, 3),
+        **merge_runs(runs, statistics.median),
+        # (max - min) / median over the runs; regressions must clear this too
+        "spread": merge_runs(runs, relative_spread),
+    }
+
+    if not results["meta"]["dictionary_loaded"]:
+        print(
+            "WARNING: en_es_aidict.json did not load (SPANISH_DICT is empty); these numbers "
+            "measure the no-dictionary fallback, not the real annotation path",
+            file=sys.stderr,
+        )
+        if not args.allow_missing_dictionary:
+            sys.exit(2)
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    print(output)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("dictionary_loaded") != results["meta"]["dictionary_loaded"]:
+            print("Baseline and this run differ in whether the dictionary loaded; not comparable", file=sys.stderr)
+            sys.exit(2)
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed past {args.threshold:.0%} and their run spread:", file=sys.stderr)
+            for r in regressions:
+                print(f"  {r}", file=sys.stderr)
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.threshold:.0%} or the run spread against {args.baseline}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Offline evaluation of the self-disclosure pre-filter that gates LLM fact
+extraction, against the labeled sample in data/self_disclosure_sample.json.
+
+Reports recall/precision of is_self_disclosure() and its LLM call count next
+to the old message-count heuristic (first 6 messages, every 8th message, or
+fewer than 3 known facts), replaying the sample as one conversation. The
+pre-filter calls once per disclosure, so whether it beats the old rule
+depends on how often learners disclose; the sample aims for a realistic
+share (about 1 turn in 6). A negative call_reduction_vs_old means more calls
+than the old rule, and is also printed as a warning.
+
+Run from the repo root:
+    python -m backend.benchmarks.fact_gate
+    python -m backend.benchmarks.fact_gate --min-recall 0.9 --show-errors
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+SAMPLE_PATH = os.path.join(os.path.dirname(__file__), "data", "self_disclosure_sample.json")
+
+
+def old_heuristic_calls(sample: list[dict]) -> list[bool]:
+    """Which turns the previous count-based rule would have sent to the LLM"""
+    calls, facts = [], 0
+    for turn, entry in enumerate(sample):
+        message_count = turn * 2  # user + bot message per earlier turn
+        call = message_count <= 6 or message_count % 8 == 0 or facts < 3
+        if call and entry["label"]:
+            facts += 1  # assume the LLM picks up the disclosed fact
+        calls.append(call)
+    return calls
+
+
+def score(predicted: list[bool], labels: list[bool]) -> dict:
+    tp = sum(p and l for p, l in zip(predicted, labels))
+    fp = sum(p and not l for p, l in zip(predicted, labels))
+    fn = sum(l and not p for p, l in zip(predicted, labels))
+    return {
+        "calls": sum(predicted),
+        "recall": round(tp / (tp + fn), 3) if tp + fn else None,
+        "precision": round(tp / (tp + fp), 3) if tp + fp else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sample", default=SAMPLE_PATH)
+    parser.add_argument("--min-recall", type=float, default=None, help="exit non-zero below this recall")
+    parser.add_argument("--show-errors", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.sample, "r", encoding="utf-8") as f:
+        sample = json.load(f)
+    labels = [e["label"] for e in sample]
+
+    from backend.references.self_disclosure import is_self_disclosure
+
+    start = time.perf_counter()
+    predicted = [is_self_disclosure(e["text"]) for e in sample]
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    gate = score(predicted, labels)
+    old = score(old_heuristic_calls(sample), labels)
+    results = {
+        "turns": len(sample),
+        "disclosures": sum(labels),
+        "disclosure_share": round(sum(labels) / len(sample), 3),
+        "prefilter": gate,
+        "old_heuristic": old,
+        "call_reduction_vs_old": round(1 - gate["calls"] / old["calls"], 3) if old["calls"] else None,
+        "extra_calls_vs_old": gate["calls"] - old["calls"],
+        "call_reduction_vs_always": round(1 - gate["calls"] / len(sample), 3),
+        "prefilter_ms_per_message": round(elapsed_ms / len(sample), 3),
+    }
+    print(json.dumps(results, indent=2))
+    if gate["calls"] > old["calls"]:
+        print(
+            f"Pre-filter makes {gate['calls'] - old['calls']} more LLM calls than the old rule "
+            f"({gate['calls']} vs {old['calls']})",
+            file=sys.stderr,
+        )
+
+    if args.show_errors:
+        for entry, p in zip(sample, predicted):
+            if p != entry["label"]:
+                kind = "missed" if entry["label"] else "false positive"
+                print(f"  {kind}: {entry['text']}", file=sys.stderr)
+
+    if args.min_recall is not None and (gate["recall"] or 0) < args.min_recall:
+        print(f"Recall {gate['recall']} is below {args.min_recall}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Compare the old serialization path of GET /sessions/{id}/messages
+(dict rows -> jsonable_encoder -> json.dumps) with RecordResponse, and report
+payload sizes with gzip/brotli.
+
+Run from the repo root:
+    python -m backend.benchmarks.serialization --messages 200
+"""
+import argparse
+import gzip
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from backend.core.responses import RecordResponse, brotli
+
+WORDS = ["qué", "onda", "güey", "neta", "está", "chido", "vamos", "al", "cine", "mañana",
+         "me", "gusta", "la", "música", "pues", "sí", "no", "tal", "vez", "jaja"]
+
+
+def make_rows(n: int) -> list[dict]:
+    """Synthetic message rows shaped like asyncpg returns them (JSONB decoded)"""
+    rnd = random.Random(42)
+    session_id = uuid.uuid4()
+    start = datetime(2025, 1, 1)
+    rows = []
+    for i in range(n):
+        words = [rnd.choice(WORDS) for _ in range(rnd.randint(4, 20))]
+        content = " ".join(words)
+        tokens = None
+        if i % 2:
+            tokens, idx = [], 0
+            for w in words:
+                tokens.append({"index": idx, "word": w,
+                               "blurb": f"**{w}**\nTranslation: ...\nExample: {content}\n→ ..."})
+                idx += len(w) + 1
+        rows.append({
+            "id": i + 1,
+            "session_id": session_id,
+            "sender": "bot" if i % 2 else "user",
+            "content": content,
+            "token_metadata": tokens,
+            "created_at": start + timedelta(seconds=30 * i),
+        })
+    return rows
+
+
+def timeit(fn, repeat: int) -> float:
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rows = make_rows(args.messages)
+
+    def baseline():
+        return JSONResponse(jsonable_encoder([dict(r) for r in rows])).body
+
+    def fast():
+        return RecordResponse(rows).body
+
+    baseline_ms = timeit(baseline, args.repeat)
+    fast_ms = timeit(fast, args.repeat)
+    baseline_body, fast_body = baseline(), fast()
+
+    print(f"{args.messages} messages, mean of {args.repeat} runs")
+    print(f"  jsonable_encoder + json: {baseline_ms:8.3f} ms  {len(baseline_body):>9} bytes")
+    print(f"  RecordResponse (orjson): {fast_ms:8.3f} ms  {len(fast_body):>9} bytes  ({baseline_ms / fast_ms:.1f}x faster)")
+    print(f"  + gzip:                  {timeit(lambda: gzip.compress(fast_body, 6), 20):8.3f} ms  "
+          f"{len(gzip.compress(fast_body, 6)):>9} bytes")
+    if brotli is not None:
+        print(f"  + brotli (q4):           {timeit(lambda: brotli.compress(fast_body, quality=4), 20):8.3f} ms  "
+              f"{len(brotli.compress(fast_body, quality=4)):>9} bytes")
+    else:
+        print("  + brotli: not installed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from fastapi import Depends, HTTPException, Request
+from backend.core.utils import get_current_user, get_db
+
+# Per-user token bucket for chat turns: burst size and sustained rate
+RATE_LIMIT_CAPACITY = float(os.getenv("RATE_LIMIT_CAPACITY", "10"))
+RATE_LIMIT_REFILL_PER_SEC = float(os.getenv("RATE_LIMIT_REFILL_PER_SEC", "0.2"))
+# "memory" limits per worker; "postgres" shares buckets across workers
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_MAX_USERS = int(os.getenv("RATE_LIMIT_MAX_USERS", "10000"))
+# Separate bucket for POST /annotate, which runs spaCy on client-supplied text
+ANNOTATE_RATE_LIMIT_CAPACITY = float(os.getenv("ANNOTATE_RATE_LIMIT_CAPACITY", "30"))
+ANNOTATE_RATE_LIMIT_REFILL_PER_SEC = float(os.getenv("ANNOTATE_RATE_LIMIT_REFILL_PER_SEC", "1"))
+
+# Upstream LLM calls allowed in flight per worker, and how many may wait for a slot
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+
+# Priorities: lower is served first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# How long a call may wait for a slot before it is shed
+QUEUE_DEADLINES = {
+    INTERACTIVE: float(os.getenv("LLM_QUEUE_DEADLINE_SECONDS", "10")),
+    BACKGROUND: float(os.getenv("LLM_BACKGROUND_QUEUE_DEADLINE_SECONDS", "2")),
+}
+
+
+class TokenBuckets:
+    """In-process token buckets keyed by user, oldest-idle users evicted first"""
+
+    def __init__(self, capacity: float, refill_per_sec: float, max_keys: int):
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+
+    def take(self, key, cost: float = 1.0) -> float:
+        """Consume `cost` tokens. Returns 0 on success, else seconds until enough refill."""
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated_at) * self.refill_per_sec)
+        if tokens >= cost:
+            tokens -= cost
+            wait = 0.0
+        else:
+            wait = (cost - tokens) / self.refill_per_sec
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+async def take_token_postgres(db, key: str, capacity: float, refill_per_sec: float, cost: float = 1.0) -> float:
+    """Same as TokenBuckets.take, but the bucket lives in Postgres so every worker shares it"""
+    async with db.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                """
+                INSERT INTO rate_limit_buckets (key, tokens, updated_at)
+                VALUES ($1, $2, clock_timestamp())
+                ON CONFLICT (key) DO NOTHING
+                """,
+                key, capacity
+            )
+            row = await conn.fetchrow(
+                """
+                SELECT tokens, EXTRACT(EPOCH FROM clock_timestamp() - updated_at)::float8 AS elapsed
+                FROM rate_limit_buckets
+                WHERE key = $1
+                FOR UPDATE
+                """,
+                key
+            )
+            tokens = min(capacity, row["tokens"] + row["elapsed"] * refill_per_sec)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / refill_per_sec
+            await conn.execute(
+                "UPDATE rate_limit_buckets SET tokens = $2, updated_at = clock_timestamp() WHERE key = $1",
+                key, tokens
+            )
+    return wait
+
+
+class AdmissionQueue:
+    """
+    Caps in-flight upstream calls. Callers beyond the cap wait in a bounded
+    priority queue; they are shed with a 503 when the queue is full or their
+    deadline passes, rather than piling up until the client times out.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        # Moving average of how long a slot is held, for Retry-After estimates
+        self._avg_hold = 5.0
+
+    def retry_after(self) -> int:
+        backlog = len(self._waiters) + 1
+        return max(1, math.ceil(self._avg_hold * backlog / self.max_concurrency))
+
+    def _overloaded(self, detail: str):
+        return HTTPException(
+            status_code=503,
+            detail=detail,
+            headers={"Retry-After": str(self.retry_after())},
+        )
+
+    async def acquire(self, priority: int, deadline: float):
+        if self.in_flight < self.max_concurrency and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._overloaded("Server busy, try again shortly")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await asyncio.wait_for(future, timeout=deadline)
+        except asyncio.TimeoutError:
+            raise self._overloaded("Timed out waiting for capacity")
+        except asyncio.CancelledError:
+            # Slot was handed over just as the caller went away; pass it on
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self, held_for: float = None):
+        if held_for is not None:
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * held_for
+        self.in_flight -= 1
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+                break
+
+    @asynccontextmanager
+    async def slot(self, priority: int = INTERACTIVE):
+        await self.acquire(priority, QUEUE_DEADLINES[priority])
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+
+llm_queue = AdmissionQueue(LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE)
+
+
+def llm_slot(priority: int = INTERACTIVE):
+    """Hold one of the worker's upstream LLM slots: `async with llm_slot(): ...`"""
+    return llm_queue.slot(priority)
+
+
+def rate_limiter(name: str, capacity: float, refill_per_sec: float, detail: str = "Too many requests, slow down"):
+    """A get_current_user dependency that also charges one token from the user's `name` bucket"""
+    buckets = TokenBuckets(capacity, refill_per_sec, RATE_LIMIT_MAX_USERS)
+
+    async def limited_user(request: Request, current_user: dict = Depends(get_current_user)):
+        if RATE_LIMIT_BACKEND == "postgres":
+            wait = await take_token_postgres(
+                get_db(request), f"{name}:{current_user['id']}", capacity, refill_per_sec
+            )
+        else:
+            wait = buckets.take(current_user["id"])
+
+        if wait > 0:
+            raise HTTPException(
+                status_code=429,
+                detail=detail,
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+        return current_user
+
+    return limited_user
+
+
+# Chat turns
+rate_limited_user = rate_limiter("chat", RATE_LIMIT_CAPACITY, RATE_LIMIT_REFILL_PER_SEC, "Too many messages, slow down")
+# POST /annotate
+annotate_rate_limited_user = rate_limiter("annotate", ANNOTATE_RATE_LIMIT_CAPACITY, ANNOTATE_RATE_LIMIT_REFILL_PER_SEC)
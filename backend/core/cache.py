@@ -0,0 +1,178 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+import asyncpg
+
+# Postgres channel carrying "<origin>:<cache name>:<key>" payloads
+CHANNEL = "cache_invalidation"
+# LISTEN needs a real session, so this must bypass PgBouncer in transaction mode
+LISTEN_URL = os.getenv("CACHE_LISTEN_URL") or os.getenv("DATABASE_URL")
+# Entries expire after this many seconds even if no invalidation arrives
+CACHE_TTL = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+RECONNECT_DELAY = 2
+
+
+class LocalCache:
+    """
+    Per-worker LRU cache whose entries are evicted by the invalidation bus.
+    Keys are compared as strings. Nothing is cached while the bus is
+    disconnected, since evictions sent by other workers would be missed.
+    """
+
+    def __init__(self, name: str, ttl: float = CACHE_TTL, max_entries: int = CACHE_MAX_ENTRIES):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # Bumped on every eviction so a load that raced an invalidation isn't stored
+        self._generation = 0
+
+    def get(self, key):
+        key = str(key)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        key = str(key)
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def evict(self, key):
+        self._generation += 1
+        self._entries.pop(str(key), None)
+
+    def clear(self):
+        self._generation += 1
+        self._entries.clear()
+
+    async def get_or_load(self, key, loader):
+        """Return the cached value for key, or await loader() and cache its result"""
+        value = self.get(key)
+        if value is not None:
+            return value
+        generation = self._generation
+        value = await loader()
+        if value is not None and bus.connected and generation == self._generation:
+            self.set(key, value)
+        return value
+
+
+class InvalidationBus:
+    """One LISTEN connection per worker that evicts entries from local caches"""
+
+    def __init__(self):
+        self.caches: dict[str, LocalCache] = {}
+        # Lets a worker skip its own notifications when it updated the entry in place
+        self.worker_id = uuid.uuid4().hex[:12]
+        self.connected = False
+        self._conn = None
+        self._task = None
+        self._lost = None
+
+    def register(self, name: str, **kwargs) -> LocalCache:
+        return self.attach(name, LocalCache(name, **kwargs))
+
+    def attach(self, name: str, cache):
+        """Route evictions for `name` to any cache with evict(key) and clear()"""
+        self.caches[name] = cache
+        return cache
+
+    def clear_all(self):
+        for cache in self.caches.values():
+            cache.clear()
+
+    def _on_notification(self, conn, pid, channel, payload):
+        origin, _, rest = payload.partition(":")
+        if origin == self.worker_id:
+            return
+        name, _, key = rest.partition(":")
+        cache = self.caches.get(name)
+        if cache is not None:
+            cache.evict(key)
+
+    def _on_termination(self, conn):
+        self._set_disconnected()
+
+    def _set_disconnected(self):
+        self.connected = False
+        self.clear_all()
+        if self._lost is not None:
+            self._lost.set()
+
+    async def _run(self, dsn: str):
+        while True:
+            try:
+                self._lost = asyncio.Event()
+                self._conn = await asyncpg.connect(dsn)
+                self._conn.add_termination_listener(self._on_termination)
+                await self._conn.add_listener(CHANNEL, self._on_notification)
+                # Anything cached before (re)connecting may have missed evictions
+                self.clear_all()
+                self.connected = True
+                await self._lost.wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Cache invalidation listener error: {e}")
+                self._set_disconnected()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def start(self, dsn: str = LISTEN_URL):
+        self._task = asyncio.create_task(self._run(dsn))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        self.connected = False
+        if self._conn is not None and not self._conn.is_closed():
+            await self._conn.close()
+
+    async def notify(self, conn, name: str, key, keep_local: bool = False):
+        """
+        Evict name:key here and in every other worker. Run on the connection that
+        made the write; inside a transaction Postgres delivers it on commit.
+        With keep_local the caller has already updated its own entry in place,
+        so only other workers evict.
+        """
+        await self.notify_many(conn, [(name, key, keep_local)])
+
+    async def notify_many(self, conn, entries):
+        """notify() for several (name, key, keep_local) entries in one round trip"""
+        payloads = []
+        for name, key, keep_local in entries:
+            origin = ""
+            if keep_local:
+                origin = self.worker_id
+            else:
+                self.caches[name].evict(key)
+            payloads.append(f"{origin}:{name}:{key}")
+        await conn.execute(
+            "SELECT pg_notify($1, payload) FROM unnest($2::text[]) AS payload",
+            CHANNEL, payloads
+        )
+
+
+bus = InvalidationBus()
+
+# auth0 sub -> users.id
+user_ids = bus.register("user_id")
+# users.id -> settings row (dialect, experience_level, display name, ...)
+user_settings = bus.register("user_settings")
+# users.id -> facts dict
+user_facts = bus.register("user_facts")
+# session id -> sessions row, including user_id for ownership checks
+session_rows = bus.register("session")
+# users.id -> list of the user's sessions as returned by GET /sessions/
+session_lists = bus.register("session_list")
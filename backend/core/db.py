@@ -0,0 +1,98 @@
+import asyncio
+import os
+import asyncpg
+import orjson
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+# Close connections idle for this long (seconds, 0 disables)
+MAX_INACTIVE_CONNECTION_LIFETIME = float(os.getenv("DB_MAX_INACTIVE_CONNECTION_LIFETIME", "300"))
+COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "30"))
+# Startup migrations and maintenance can take far longer than a request, so they
+# use their own connection with this timeout instead (seconds, 0 = no limit)
+MAINTENANCE_COMMAND_TIMEOUT = float(os.getenv("DB_MAINTENANCE_COMMAND_TIMEOUT", "0")) or None
+
+# Prepared statement cache, per connection. The app only issues a few dozen
+# distinct queries, so a small cache that never expires covers all of them.
+STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+MAX_CACHED_STATEMENT_LIFETIME = int(os.getenv("DB_MAX_CACHED_STATEMENT_LIFETIME", "0"))
+
+# Behind PgBouncer in transaction pooling mode consecutive statements may land
+# on different server connections, so named prepared statements can't be reused.
+PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() in ("1", "true", "yes")
+
+# JIT makes asyncpg's type introspection queries very slow on first use
+JIT = os.getenv("DB_JIT", "off")
+
+
+def _encode_jsonb(value) -> bytes:
+    # Binary jsonb format is a version byte followed by the JSON text
+    return b"\x01" + orjson.dumps(value)
+
+
+def _decode_jsonb(data: bytes):
+    return orjson.loads(data[1:])
+
+
+def _encode_json(value) -> str:
+    return orjson.dumps(value).decode("utf-8")
+
+
+async def init_connection(conn):
+    """Runs once for every new connection in the pool"""
+    await conn.set_type_codec(
+        "jsonb", schema="pg_catalog", format="binary",
+        encoder=_encode_jsonb, decoder=_decode_jsonb,
+    )
+    await conn.set_type_codec(
+        "json", schema="pg_catalog", format="text",
+        encoder=_encode_json, decoder=orjson.loads,
+    )
+
+
+def _connection_options() -> dict:
+    server_settings = {"jit": JIT}
+    statement_cache_size = STATEMENT_CACHE_SIZE
+    if PGBOUNCER:
+        # PgBouncer rejects most startup parameters and can't keep named statements
+        server_settings = {}
+        statement_cache_size = 0
+    return {
+        "statement_cache_size": statement_cache_size,
+        "max_cached_statement_lifetime": MAX_CACHED_STATEMENT_LIFETIME,
+        "server_settings": server_settings,
+    }
+
+
+async def create_pool(dsn: str = DATABASE_URL) -> asyncpg.Pool:
+    """Create the app's connection pool from the DB_* environment settings"""
+    return await asyncpg.create_pool(
+        dsn,
+        min_size=POOL_MIN_SIZE,
+        max_size=POOL_MAX_SIZE,
+        max_inactive_connection_lifetime=MAX_INACTIVE_CONNECTION_LIFETIME,
+        command_timeout=COMMAND_TIMEOUT,
+        init=init_connection,
+        **_connection_options(),
+    )
+
+
+async def connect_maintenance(dsn: str = DATABASE_URL) -> asyncpg.Connection:
+    """A standalone connection for schema changes and maintenance, without the request timeout"""
+    conn = await asyncpg.connect(dsn, command_timeout=MAINTENANCE_COMMAND_TIMEOUT, **_connection_options())
+    await init_connection(conn)
+    return conn
+
+
+async def warm_up(pool: asyncpg.Pool):
+    """
+    Check out min_size connections at once and round-trip on each, so the first
+    requests don't pay for connecting, codec setup or type introspection.
+    """
+    async def ping():
+        async with pool.acquire() as conn:
+            await conn.fetchval("SELECT $1::jsonb", {})
+
+    await asyncio.gather(*(ping() for _ in range(POOL_MIN_SIZE)))
@@ -0,0 +1,334 @@
+import asyncio
+import os
+import zlib
+from datetime import date, datetime
+import orjson
+from backend.core.cache import bus, session_rows
+from backend.core.db import connect_maintenance
+
+# How many months of message partitions to keep created ahead of now
+PARTITIONS_AHEAD = int(os.getenv("MESSAGE_PARTITIONS_AHEAD", "3"))
+# Sessions untouched for this long get their messages moved to cold storage
+ARCHIVE_AFTER_DAYS = int(os.getenv("SESSION_ARCHIVE_AFTER_DAYS", "30"))
+# Partitions older than this are archived in bulk and dropped
+RETENTION_MONTHS = int(os.getenv("MESSAGE_RETENTION_MONTHS", "12"))
+# Seconds between maintenance runs
+MAINTENANCE_INTERVAL = int(os.getenv("MAINTENANCE_INTERVAL_SECONDS", "3600"))
+# Max sessions archived per run, so one pass never holds a connection for long
+ARCHIVE_BATCH_SIZE = int(os.getenv("SESSION_ARCHIVE_BATCH_SIZE", "100"))
+
+# Arbitrary advisory lock key so only one worker at a time changes the schema or runs maintenance
+MAINTENANCE_LOCK_ID = 727_001
+
+
+class MaintenanceBusy(Exception):
+    """Another worker holds the maintenance lock"""
+
+
+async def take_maintenance_lock(conn):
+    """
+    Take the maintenance lock for the current transaction, or raise
+    MaintenanceBusy. Every maintenance step takes it again in its own short
+    transaction, so table locks (ACCESS EXCLUSIVE on messages for partition
+    DDL) are never held across steps. Re-entrant within prepare_database.
+    """
+    if not await conn.fetchval("SELECT pg_try_advisory_xact_lock($1)", MAINTENANCE_LOCK_ID):
+        raise MaintenanceBusy()
+
+PARTITION_PREFIX = "messages_p"
+
+
+def month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def add_months(d: date, months: int) -> date:
+    total = d.year * 12 + (d.month - 1) + months
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARTITION_PREFIX}{month:%Y%m}"
+
+
+async def create_month_partition(conn, month: date):
+    """Create the partition covering `month` if it doesn't exist yet"""
+    month = month_start(month)
+    await conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {partition_name(month)}
+        PARTITION OF messages
+        FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')
+        """
+    )
+
+
+async def ensure_message_partitions(conn, months_ahead: int = PARTITIONS_AHEAD):
+    """Make sure partitions exist for the current month and the next few"""
+    current = month_start(date.today())
+    for offset in range(months_ahead + 1):
+        async with conn.transaction():
+            await take_maintenance_lock(conn)
+            await create_month_partition(conn, add_months(current, offset))
+
+
+async def list_month_partitions(conn) -> list[tuple[str, date]]:
+    """Return (name, month) for every monthly partition of messages, oldest first"""
+    rows = await conn.fetch(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'messages'
+        """
+    )
+    partitions = []
+    for r in rows:
+        name = r["relname"]
+        suffix = name[len(PARTITION_PREFIX):]
+        if not name.startswith(PARTITION_PREFIX) or not suffix.isdigit():
+            continue  # e.g. messages_default
+        partitions.append((name, date(int(suffix[:4]), int(suffix[4:]), 1)))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+def compress_messages(rows) -> bytes:
+    payload = [
+        {
+            "id": r["id"],
+            "sender": r["sender"],
+            "content": r["content"],
+            "token_metadata": r["token_metadata"],
+            "token_metadata_version": r.get("token_metadata_version"),
+            "created_at": r["created_at"],
+        }
+        for r in rows
+    ]
+    return zlib.compress(orjson.dumps(payload))
+
+
+def decompress_messages(payload: bytes) -> list[dict]:
+    messages = orjson.loads(zlib.decompress(payload))
+    for m in messages:
+        m["created_at"] = datetime.fromisoformat(m["created_at"])
+        m.setdefault("token_metadata_version", None)  # batches archived before it was stored
+    return messages
+
+
+async def write_archive(conn, session_id, rows):
+    """Store one compressed batch of a session's messages in message_archives"""
+    await conn.execute(
+        """
+        INSERT INTO message_archives
+            (session_id, message_count, first_created_at, last_created_at, min_message_id, max_message_id, payload)
+        VALUES ($1, $2, $3, $4, $5, $6, $7)
+        """,
+        session_id, len(rows), rows[0]["created_at"], rows[-1]["created_at"],
+        min(r["id"] for r in rows), max(r["id"] for r in rows), compress_messages(rows)
+    )
+    await conn.execute(
+        "UPDATE sessions SET archived_at = NOW() WHERE id = $1",
+        session_id
+    )
+    await bus.notify(conn, "session", session_id)
+
+
+async def load_archive_batches(conn, session_id) -> list[tuple[int, list[dict]]]:
+    """Return (archive id, messages) for each of a session's cold batches, oldest first"""
+    rows = await conn.fetch(
+        """
+        SELECT id, payload FROM message_archives
+        WHERE session_id = $1
+        ORDER BY first_created_at ASC
+        """,
+        session_id
+    )
+    return [(r["id"], decompress_messages(r["payload"])) for r in rows]
+
+
+async def load_archived_messages(conn, session_id) -> list[dict]:
+    """Return a session's cold messages, oldest first, shaped like rows from messages"""
+    messages = []
+    for _, batch in await load_archive_batches(conn, session_id):
+        messages.extend(batch)
+    return messages
+
+
+async def rewrite_archive(conn, archive_id: int, messages: list[dict]):
+    """Store an archive batch again after its messages were changed in place (e.g. re-annotated)"""
+    await conn.execute(
+        "UPDATE message_archives SET payload = $2 WHERE id = $1",
+        archive_id, compress_messages(messages)
+    )
+
+
+async def archive_idle_sessions(conn, idle_days: int = ARCHIVE_AFTER_DAYS, limit: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Move messages of sessions idle for more than `idle_days` into message_archives.
+    The session row (summary, name, dialect) stays hot. Returns sessions archived.
+    A session with a recent message is never idle, even if updated_at lags (it
+    wasn't bumped on new messages before partitioning).
+    """
+    sessions = await conn.fetch(
+        """
+        SELECT s.id FROM sessions s
+        WHERE s.updated_at < NOW() - make_interval(days => $1)
+          AND EXISTS (SELECT 1 FROM messages m WHERE m.session_id = s.id)
+          AND NOT EXISTS (
+              SELECT 1 FROM messages m
+              WHERE m.session_id = s.id AND m.created_at >= NOW() - make_interval(days => $1)
+          )
+        ORDER BY s.updated_at ASC
+        LIMIT $2
+        """,
+        idle_days, limit
+    )
+    for s in sessions:
+        async with conn.transaction():
+            await take_maintenance_lock(conn)
+            rows = await conn.fetch(
+                """
+                DELETE FROM messages WHERE session_id = $1
+                RETURNING id, sender, content, token_metadata, token_metadata_version, created_at
+                """,
+                s["id"]
+            )
+            if rows:
+                rows = sorted(rows, key=lambda r: (r["created_at"], r["id"]))
+                await write_archive(conn, s["id"], rows)
+    return len(sessions)
+
+
+async def drop_expired_partitions(conn, retention_months: int = RETENTION_MONTHS) -> list[str]:
+    """
+    Archive whatever is left in partitions older than the retention window and
+    drop them whole, instead of deleting their rows one by one. Rows are moved
+    one session per transaction, which only locks the partition itself; the
+    brief DETACH, which locks all of messages, runs once it's empty.
+    """
+    cutoff = add_months(month_start(date.today()), -retention_months)
+    dropped = []
+    for name, month in await list_month_partitions(conn):
+        if add_months(month, 1) > cutoff:
+            break
+        sessions = await conn.fetch(f"SELECT DISTINCT session_id FROM {name}")
+        for s in sessions:
+            async with conn.transaction():
+                await take_maintenance_lock(conn)
+                rows = await conn.fetch(
+                    f"""
+                    DELETE FROM {name} WHERE session_id = $1
+                    RETURNING id, sender, content, token_metadata, token_metadata_version, created_at
+                    """,
+                    s["session_id"]
+                )
+                if rows:
+                    rows = sorted(rows, key=lambda r: (r["created_at"], r["id"]))
+                    await write_archive(conn, s["session_id"], rows)
+        async with conn.transaction():
+            await take_maintenance_lock(conn)
+            if await conn.fetchval(f"SELECT EXISTS (SELECT 1 FROM {name})"):
+                continue  # a late insert; picked up next pass
+            await conn.execute(f"ALTER TABLE messages DETACH PARTITION {name}")
+            await conn.execute(f"DROP TABLE {name}")
+        dropped.append(name)
+    return dropped
+
+
+async def migrate_unpartitioned_messages(conn):
+    """Copy rows from a pre-partitioning messages table into the partitioned one"""
+    legacy = await conn.fetchval("SELECT to_regclass('messages_unpartitioned')")
+    if legacy is None:
+        return
+
+    async with conn.transaction():
+        bounds = await conn.fetchrow(
+            "SELECT MIN(created_at) AS first, MAX(created_at) AS last FROM messages_unpartitioned"
+        )
+        if bounds["first"] is not None:
+            month = month_start(bounds["first"].date())
+            while month <= bounds["last"].date():
+                await create_month_partition(conn, month)
+                month = add_months(month, 1)
+
+        count = await conn.fetchval(
+            """
+            WITH moved AS (
+                INSERT INTO messages (id, session_id, sender, content, token_metadata, created_at)
+                SELECT id, session_id, sender, content, token_metadata, COALESCE(created_at, NOW())
+                FROM messages_unpartitioned
+                WHERE session_id IS NOT NULL
+                RETURNING 1
+            )
+            SELECT COUNT(*) FROM moved
+            """
+        )
+        # updated_at used to change only on rename; make it reflect the last message
+        await conn.execute(
+            """
+            UPDATE sessions s
+            SET updated_at = GREATEST(s.updated_at, last.created_at)
+            FROM (
+                SELECT session_id, MAX(created_at) AS created_at
+                FROM messages_unpartitioned
+                GROUP BY session_id
+            ) last
+            WHERE last.session_id = s.id
+              AND (s.updated_at IS NULL OR s.updated_at < last.created_at)
+            """
+        )
+        await conn.execute(
+            """
+            SELECT setval(pg_get_serial_sequence('messages', 'id'),
+                          GREATEST((SELECT MAX(id) FROM messages), 1))
+            """
+        )
+        await conn.execute("DROP TABLE messages_unpartitioned")
+    print(f"Migrated {count} messages into partitioned table")
+
+
+async def prepare_database(conn, schema_sql: str):
+    """
+    Startup: apply the schema, migrate a legacy messages table and create
+    partitions. Every worker runs this, so they wait their turn on the
+    maintenance lock; the rename in schema.sql and the copy commit together.
+    """
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", MAINTENANCE_LOCK_ID)
+        await conn.execute(schema_sql)
+        await migrate_unpartitioned_messages(conn)
+        await ensure_message_partitions(conn)
+
+
+async def run_maintenance(conn):
+    """
+    One maintenance pass; stops as soon as another worker holds the lock. The
+    lock is transaction-scoped so it can't leak behind PgBouncer in transaction
+    mode, and each step commits on its own.
+    """
+    archived, dropped = 0, []
+    try:
+        await ensure_message_partitions(conn)
+        archived = await archive_idle_sessions(conn)
+        dropped = await drop_expired_partitions(conn)
+    except MaintenanceBusy:
+        pass
+    if archived or dropped:
+        # Local evictions happen just before each commit; drop rows re-read in between
+        session_rows.clear()
+        print(f"Maintenance: archived {archived} sessions, dropped partitions {dropped}")
+
+
+async def maintenance_loop(interval: int = MAINTENANCE_INTERVAL):
+    """Background task started from the app lifespan"""
+    while True:
+        try:
+            conn = await connect_maintenance()
+            try:
+                await run_maintenance(conn)
+            finally:
+                await conn.close()
+        except Exception as e:
+            print(f"Error running maintenance: {e}")
+        await asyncio.sleep(interval)
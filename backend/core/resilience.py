@@ -0,0 +1,168 @@
+import asyncio
+import os
+import time
+from collections import deque
+import httpx
+from backend.core.admission import INTERACTIVE, llm_slot
+
+# Give up on an auxiliary call (summary, facts) after this many seconds overall
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT_SECONDS", "20"))
+# Fire the hedged request once the primary is slower than this percentile of its recent calls
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "90"))
+# Hedge delay bounds, and the delay used until enough latencies have been seen
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "1"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY_SECONDS", "4"))
+HEDGE_MIN_SAMPLES = 20
+# Consecutive failures that open a backend's circuit, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN_SECONDS", "30"))
+
+_client = None
+
+
+def http_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(timeout=LLM_TIMEOUT)
+    return _client
+
+
+class LLMUnavailable(Exception):
+    """No backend produced an answer in time"""
+
+
+class CircuitBreaker:
+    """
+    Closed until `failure_threshold` consecutive failures, then open for
+    `cooldown` seconds. After the cooldown a single trial call is let through
+    (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if not self.trial_in_flight and time.monotonic() - self.opened_at >= self.cooldown:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def abandon(self):
+        """The call was cancelled before it could prove anything either way"""
+        self.trial_in_flight = False
+
+
+class LLMBackend:
+    """An OpenAI-compatible chat completions endpoint with its own breaker and latency history"""
+
+    def __init__(self, name: str, url: str, model: str, api_key_env: str):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.api_key_env = api_key_env
+        self.breaker = CircuitBreaker()
+        self.latencies = deque(maxlen=200)
+
+    def hedge_delay(self) -> float:
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        ordered = sorted(self.latencies)
+        idx = min(len(ordered) - 1, int(len(ordered) * HEDGE_PERCENTILE / 100))
+        return max(HEDGE_MIN_DELAY, ordered[idx])
+
+    async def complete(self, prompt: str, priority: int = INTERACTIVE) -> str:
+        async with llm_slot(priority):
+            start = time.monotonic()
+            try:
+                response = await http_client().post(
+                    self.url,
+                    headers={"Authorization": f"Bearer {os.environ.get(self.api_key_env, '')}"},
+                    json={
+                        "model": self.model,
+                        "messages": [{"role": "user", "content": prompt}],
+                    },
+                )
+                response.raise_for_status()
+                content = response.json()["choices"][0]["message"]["content"]
+            except asyncio.CancelledError:
+                self.breaker.abandon()
+                raise
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            self.latencies.append(time.monotonic() - start)
+            self.breaker.record_success()
+            return content
+
+
+class HedgedLLM:
+    """
+    Sends a prompt to the primary backend. If it hasn't answered by its usual
+    tail latency (or fails), the same prompt goes to the secondary and the first
+    answer wins. Backends with an open circuit are skipped.
+    """
+
+    def __init__(self, primary: LLMBackend, secondary: LLMBackend = None, timeout: float = LLM_TIMEOUT):
+        self.primary = primary
+        self.secondary = secondary
+        self.timeout = timeout
+
+    async def complete(self, prompt: str, priority: int = INTERACTIVE) -> str:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        running = {}  # task -> backend
+        errors = []
+
+        def launch(backend):
+            if backend is not None and backend.breaker.allow():
+                running[asyncio.create_task(backend.complete(prompt, priority))] = backend
+                return True
+            return False
+
+        hedged = not launch(self.primary)
+        if hedged:
+            # Primary's circuit is open, go straight to the secondary
+            launch(self.secondary)
+        hedge_at = loop.time() + self.primary.hedge_delay()
+
+        try:
+            while running:
+                now = loop.time()
+                if now >= deadline:
+                    for task, backend in running.items():
+                        backend.breaker.record_failure()  # a stall counts against it
+                    break
+                wait_until = deadline if hedged else min(hedge_at, deadline)
+                done, _ = await asyncio.wait(
+                    running, timeout=wait_until - now, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    backend = running.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(f"{backend.name}: {task.exception()!r}")
+                if not hedged and (not running or loop.time() >= hedge_at):
+                    hedged = True
+                    launch(self.secondary)
+        finally:
+            for task in running:
+                task.cancel()
+
+        raise LLMUnavailable("; ".join(errors) or "timed out or all circuits open")
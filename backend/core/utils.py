@@ -3,6 +3,7 @@ from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import jwt, JWTError
 import requests
 import os
+from backend.core.cache import user_ids, user_settings, user_facts, session_rows
 
 ALGORITHMS = ["RS256"]
 security = HTTPBearer()
@@ -28,6 +29,37 @@ async def ensure_user(conn, sub: str):
     row = await conn.fetchrow("SELECT id FROM users WHERE auth0_id=$1", sub)
     return row["id"]
 
+async def get_user_settings_cached(conn, user_id: int):
+    async def load():
+        row = await conn.fetchrow(
+            "SELECT id, auth0_id, email, display_name, dialect, experience_level FROM users WHERE id=$1",
+            user_id
+        )
+        return dict(row) if row else None
+    return await user_settings.get_or_load(user_id, load)
+
+async def get_user_facts_cached(conn, user_id: int) -> dict:
+    async def load():
+        return await conn.fetchval("SELECT facts FROM users WHERE id=$1", user_id)
+    return await user_facts.get_or_load(user_id, load) or {}
+
+async def get_owned_session(conn, session_id: str, user_id: int) -> dict:
+    """Return the session row (cached) or raise 404 if it isn't the user's"""
+    async def load():
+        row = await conn.fetchrow(
+            """
+            SELECT id, user_id, dialect, summary, summarized_count, session_name, created_at, updated_at, archived_at
+            FROM sessions
+            WHERE id = $1
+            """,
+            session_id
+        )
+        return dict(row) if row else None
+    session = await session_rows.get_or_load(session_id, load)
+    if not session or session["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
 async def get_current_user(
     request: Request,
     token: HTTPAuthorizationCredentials = Depends(security)
@@ -38,7 +70,7 @@ async def get_current_user(
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing sub")
 
     db = get_db(request)
-    user_id = await ensure_user(db, sub)
+    user_id = await user_ids.get_or_load(sub, lambda: ensure_user(db, sub))
 
     return {
         "id": user_id,
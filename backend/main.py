@@ -3,30 +3,46 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-import asyncpg, os
+import asyncio, os
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"))
 
 import backend.sessions.sessions as sessions
 import backend.users.users as users
+import backend.annotate.annotate as annotate
+from backend.core.db import connect_maintenance, create_pool, warm_up
+from backend.core.cache import bus
+from backend.core.responses import CompressionMiddleware, RecordResponse
+from backend.core.maintenance import maintenance_loop, prepare_database
 
-DATABASE_URL = os.getenv("DATABASE_URL")
+# Responses smaller than this many bytes are not worth compressing
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    app.state.db = await asyncpg.create_pool(DATABASE_URL, min_size=1, max_size=10)
+    app.state.db = await create_pool()
 
-    async with app.state.db.acquire() as conn:
+    # Own connection: migrating a large legacy table outlasts the pool's command timeout
+    conn = await connect_maintenance()
+    try:
         with open(os.path.join(os.path.dirname(__file__), "./models/schema.sql"), "r") as f:
             schema_sql = f.read()
-        await conn.execute(schema_sql)
+        await prepare_database(conn, schema_sql)
+    finally:
+        await conn.close()
+
+    await warm_up(app.state.db)
+    await bus.start()
+    maintenance = asyncio.create_task(maintenance_loop())
 
     yield
     # Shutdown
+    maintenance.cancel()
+    await bus.stop()
     await app.state.db.close()
 
-app = FastAPI(title="Spanish Chat App", version="0.1.0", lifespan=lifespan)
+app = FastAPI(title="Spanish Chat App", version="0.1.0", lifespan=lifespan, default_response_class=RecordResponse)
 
 # CORS (so Next.js frontend can call the API)
 app.add_middleware(
@@ -36,6 +52,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
 
 @app.get("/health")
 def health():
@@ -44,3 +61,4 @@ def health():
 # Routers
 app.include_router(sessions.router, prefix="/sessions", tags=["sessions"])
 app.include_router(users.router, prefix="/users", tags=["users"])
+app.include_router(annotate.router, prefix="/annotate", tags=["annotate"])
@@ -19,13 +19,64 @@ CREATE TABLE IF NOT EXISTS sessions (
     updated_at TIMESTAMP DEFAULT now()
 );
 
+ALTER TABLE sessions ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP;  -- set once any messages moved to cold storage
+ALTER TABLE sessions ADD COLUMN IF NOT EXISTS summarized_count INT NOT NULL DEFAULT 0;  -- messages covered by summary
+
+-- Older deployments created messages as a plain table; move it aside so the
+-- partitioned table can take its name (rows are copied over on startup).
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relname = 'messages' AND c.relkind = 'r' AND n.nspname = current_schema()
+    ) THEN
+        ALTER TABLE messages RENAME TO messages_unpartitioned;
+    END IF;
+END $$;
+
+-- Monthly range partitions (messages_pYYYYMM) are created ahead of time by
+-- backend.core.maintenance; messages_default only catches stragglers.
 CREATE TABLE IF NOT EXISTS messages (
-    id SERIAL PRIMARY KEY,
-    session_id UUID REFERENCES sessions(id) ON DELETE CASCADE,
+    id SERIAL,
+    session_id UUID NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
     sender TEXT NOT NULL,
     content TEXT NOT NULL,
     token_metadata JSONB,  -- stores parsed token information for bot messages
-    created_at TIMESTAMP DEFAULT now()
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE IF NOT EXISTS messages_default PARTITION OF messages DEFAULT;
+
+-- annotation_version() that produced token_metadata; stale rows are re-annotated lazily
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS token_metadata_version TEXT;
+
+CREATE INDEX IF NOT EXISTS messages_session_created_idx ON messages (session_id, created_at);
+
+-- Cold storage: zlib-compressed JSON batches of messages from idle sessions
+-- and from partitions that aged out of the retention window.
+CREATE TABLE IF NOT EXISTS message_archives (
+    id SERIAL PRIMARY KEY,
+    session_id UUID NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    message_count INT NOT NULL,
+    first_created_at TIMESTAMP NOT NULL,
+    last_created_at TIMESTAMP NOT NULL,
+    payload BYTEA NOT NULL,
+    archived_at TIMESTAMP DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS message_archives_session_idx ON message_archives (session_id, first_created_at);
+
+-- Bounds of the message ids in each batch, so single messages can be found by id
+ALTER TABLE message_archives ADD COLUMN IF NOT EXISTS min_message_id INT;
+ALTER TABLE message_archives ADD COLUMN IF NOT EXISTS max_message_id INT;
+
+-- Shared per-user token buckets when RATE_LIMIT_BACKEND=postgres (see backend.core.admission)
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_buckets (
+    key TEXT PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
 );
 
 CREATE TABLE IF NOT EXISTS notebook_entries (
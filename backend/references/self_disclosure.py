@@ -0,0 +1,100 @@
+from backend.references.sentence_parser import es_nlp
+
+# Verbs whose first-person use usually says something lasting about the speaker
+PREFERENCE_LEMMAS = {
+    "gustar", "encantar", "fascinar", "interesar", "odiar", "detestar", "amar", "preferir",
+    "vivir", "trabajar", "estudiar", "llamar", "nacer", "crecer",
+    "jugar", "practicar", "coleccionar", "cocinar", "viajar", "aprender",
+    "mudar", "casar", "dedicar",
+}
+
+# Verbs that only say something lasting with a real complement: "tengo dos
+# perros", "soy enfermera", "quiero vivir en Lima", not "tengo hambre", "soy yo",
+# "quiero otro ejemplo". "sé" (saber) is also lemmatized as "ser".
+WEAK_LEMMAS = {"ser", "tener", "querer"}
+WEAK_VERB_FORMS = {"soy", "tengo", "quiero"}
+
+# Complements of tener/ser that describe the moment rather than the learner
+TRANSIENT_COMPLEMENTS = {
+    "hambre", "sed", "sueño", "frío", "calor", "prisa", "razón", "ganas", "pregunta",
+    "duda", "idea", "tiempo", "problema", "cuidado", "suerte", "culpa", "trabajo",
+    "yo", "malo", "bueno",
+}
+
+# The small model often tags sentence-initial verbs as proper nouns ("Trabajo",
+# "Estudio"), so the common first-person forms are also matched literally
+FIRST_PERSON_VERB_FORMS = {
+    "vivo", "trabajo", "estudio", "odio", "amo", "detesto", "prefiero",
+    "juego", "practico", "colecciono", "cocino", "viajo", "aprendo", "nací",
+    "crecí", "viví", "trabajé", "estudié", "llamo", "dedico", "mudé", "casé",
+}
+
+FIRST_PERSON_WORDS = {"yo", "me", "mi", "mis", "mío", "mía", "míos", "mías", "conmigo", "nosotros", "nuestro", "nuestra"}
+
+ENTITY_LABELS = {"PER", "LOC", "ORG", "MISC"}
+
+
+def has_lasting_complement(doc, i: int) -> bool:
+    """Whether the weak verb at doc[i] is followed by a complement worth remembering"""
+    querer = doc[i].lemma_.lower() == "querer" or doc[i].lower_ == "quiero"
+    for token in doc[i + 1:i + 5]:
+        if token.pos_ in ("DET", "ADV", "NUM", "ADP") and token.lower_ != "que":
+            continue
+        if querer:
+            # Only plans built on a preference verb: "quiero vivir en España"
+            return token.pos_ in ("VERB", "AUX") and token.lemma_.lower() in PREFERENCE_LEMMAS
+        return token.pos_ in ("NOUN", "PROPN", "ADJ") and token.lemma_.lower() not in TRANSIENT_COMPLEMENTS \
+            and token.lower_ not in TRANSIENT_COMPLEMENTS
+    return False
+
+
+def disclosure_signals(text: str) -> dict:
+    """Which self-disclosure cues appear in a message"""
+    doc = es_nlp(text)
+    signals = {
+        "first_person": False,
+        "preference_verb": False,
+        "possessive_noun": False,
+        "entity": False,
+    }
+
+    for i, token in enumerate(doc):
+        lower = token.lower_
+        # "trabajo", "estudio" after a determiner are nouns ("mucho trabajo")
+        if lower in FIRST_PERSON_VERB_FORMS and i > 0 and doc[i - 1].pos_ == "DET":
+            lower = None
+        is_first_person = lower in FIRST_PERSON_WORDS or lower in FIRST_PERSON_VERB_FORMS or (
+            "1" in token.morph.get("Person") and "Sing" in token.morph.get("Number")
+        )
+        if is_first_person:
+            signals["first_person"] = True
+        if lower in FIRST_PERSON_VERB_FORMS or (
+            token.pos_ in ("VERB", "AUX") and token.lemma_.lower() in PREFERENCE_LEMMAS
+        ):
+            signals["preference_verb"] = True
+        elif (lower in WEAK_VERB_FORMS or (
+            token.pos_ in ("VERB", "AUX") and token.lemma_.lower() in WEAK_LEMMAS and is_first_person
+        )) and has_lasting_complement(doc, i):
+            signals["preference_verb"] = True
+        if lower in ("mi", "mis", "nuestro", "nuestra") and i + 1 < len(doc) and doc[i + 1].pos_ in ("NOUN", "PROPN"):
+            signals["possessive_noun"] = True
+
+    # The small model tags many short lowercase phrases as entities ("tengo frío",
+    # "perdón"), so only count entities with a capitalized word mid-sentence
+    signals["entity"] = any(
+        ent.label_ in ENTITY_LABELS and ent.text.lower() not in FIRST_PERSON_VERB_FORMS
+        and any(t.is_alpha and t.is_title and not t.is_sent_start for t in ent)
+        for ent in doc.ents
+    )
+    return signals
+
+
+def is_self_disclosure(text: str) -> bool:
+    """
+    Cheap local check for whether a user message tells us something about the
+    learner, used to decide if the LLM fact extractor is worth calling.
+    """
+    if not text or not text.strip():
+        return False
+    s = disclosure_signals(text)
+    return s["first_person"] and (s["preference_verb"] or s["possessive_noun"] or s["entity"])
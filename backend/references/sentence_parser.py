@@ -1,4 +1,5 @@
 import spacy
+import hashlib
 import json
 import os
 
@@ -8,10 +9,20 @@ es_nlp = spacy.load("es_core_news_sm")
 # Dictionary will be loaded here
 SPANISH_DICT = {}
 DICT_LOADED = False
+DICT_HASH = ""
+
+# Dialect slang glossary: {dialect: {term: {"definition": ..., "gloss": ...}}}
+GLOSSARY_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "slang_glossary.json")
+with open(GLOSSARY_PATH, "rb") as f:
+    glossary_bytes = f.read()
+SLANG_GLOSSARY = json.loads(glossary_bytes)
+GLOSSARY_HASH = hashlib.sha1(glossary_bytes).hexdigest()
+
+ANNOTATION_VERSION = None
 
 def load_dictionary():
     """Load the comprehensive Spanish-English dictionary from JSON file"""
-    global SPANISH_DICT, DICT_LOADED
+    global SPANISH_DICT, DICT_LOADED, DICT_HASH
     
     if DICT_LOADED:
         return
@@ -20,6 +31,7 @@ def load_dictionary():
         dict_path = os.path.join(os.path.dirname(__file__), "en_es_aidict.json")
         with open(dict_path, 'r', encoding='utf-8') as f:
             content = f.read()
+        DICT_HASH = hashlib.sha1(content.encode("utf-8")).hexdigest()
             
         # The file might be a JSON string that needs to be parsed
         if content.startswith('"[') and content.endswith(']"'):
@@ -68,12 +80,46 @@ def get_translation_info(word, lemma=None):
     
     return None
 
-def dictionary(sentence):
+def get_slang_info(word, lemma=None, dialect=None):
+    """Get the glossary entry for a word in the given dialect's slang, if any"""
+    glossary = SLANG_GLOSSARY.get(dialect) if dialect else None
+    if not glossary or not word:
+        return None
+
+    entry = glossary.get(str(word).lower())
+    if entry is None and lemma:
+        entry = glossary.get(str(lemma).lower())
+    return entry
+
+def annotation_version():
+    """
+    Identify the dictionary, glossary and model that produce token blurbs.
+    Annotations computed under a different version are stale.
+    """
+    global ANNOTATION_VERSION
+    if ANNOTATION_VERSION is None:
+        if not DICT_LOADED:
+            load_dictionary()
+        key = f"{DICT_HASH}:{GLOSSARY_HASH}:{es_nlp.meta.get('name')}-{es_nlp.meta.get('version')}"
+        ANNOTATION_VERSION = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    return ANNOTATION_VERSION
+
+def dictionary(sentence, dialect=None):
     """Parse sentence and return token information"""
     if not DICT_LOADED:
         load_dictionary()
-        
-    doc = es_nlp(sentence)
+
+    return parse_doc(es_nlp(sentence), dialect)
+
+def dictionary_batch(sentences, dialect=None, batch_size=32):
+    """Same as dictionary() for many sentences, run through nlp.pipe"""
+    if not DICT_LOADED:
+        load_dictionary()
+
+    return [parse_doc(doc, dialect) for doc in es_nlp.pipe(sentences, batch_size=batch_size)]
+
+def parse_doc(doc, dialect=None):
+    """Build (index, blurb) pairs for the tokens of a parsed doc"""
     sentence_parsed = []
     
     for token in doc:
@@ -115,12 +161,69 @@ def dictionary(sentence):
                 }
                 pos_name = pos_names.get(token.pos_, token.pos_)
                 parts.append(f"Part of Speech: {pos_name}")
+
+        slang = get_slang_info(token.text, token.lemma_, dialect)
+        if slang:
+            parts.append(f"Slang ({dialect}): {slang.get('gloss', '')} ({slang.get('definition', '')})")
         
         blurb = "\n".join(parts)
         sentence_parsed.append((token.idx, blurb))
     
     return sentence_parsed
 
+def tokens_from_parsed(text, token_data):
+    """Turn dictionary() output into word-level metadata for the frontend"""
+    tokens = []
+    for idx, blurb in token_data:
+        # Only include tokens that have meaningful content (not just punctuation or whitespace)
+        # Find the actual word at this position
+        if idx < len(text):
+            # Look for the word boundary
+            word_start = idx
+            word_end = idx
+
+            # Move to start of word if we're in the middle
+            while word_start > 0 and text[word_start - 1].isalnum():
+                word_start -= 1
+
+            # Find end of word
+            while word_end < len(text) and text[word_end].isalnum():
+                word_end += 1
+
+            # Only add if it's a real word (not just punctuation)
+            if word_end > word_start and any(c.isalpha() for c in text[word_start:word_end]):
+                tokens.append({
+                    "index": word_start,
+                    "blurb": blurb,
+                    "word": text[word_start:word_end]
+                })
+
+    return tokens
+
+def build_token_metadata(text: str, dialect=None):
+    """
+    Parse text tokens and return metadata for each token including position and blurb
+    """
+    try:
+        return tokens_from_parsed(text, dictionary(text, dialect))
+    except Exception as e:
+        print(f"Error parsing tokens: {e}")
+        return []
+
+def build_token_metadata_batch(texts: list[str], dialect=None):
+    """
+    build_token_metadata() for a batch of texts. Identical texts are parsed
+    once; results come back in the order of `texts`.
+    """
+    unique = list(dict.fromkeys(texts))
+    try:
+        parsed = dictionary_batch(unique, dialect)
+        by_text = {text: tokens_from_parsed(text, data) for text, data in zip(unique, parsed)}
+    except Exception as e:
+        print(f"Error parsing tokens: {e}")
+        by_text = {}
+    return [by_text.get(text, []) for text in texts]
+
 if __name__ == "__main__":
     # Test with a simple sentence
     test_sentence = "¿Dónde está la biblioteca?"
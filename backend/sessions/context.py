@@ -0,0 +1,167 @@
+import os
+import time
+from collections import OrderedDict, deque
+from backend.core.cache import bus
+from backend.core.maintenance import load_archived_messages
+
+# Messages sent to the model verbatim; older ones are folded into the running summary
+RECENT_MESSAGES = int(os.getenv("SESSION_CONTEXT_RECENT", "5"))
+# Drop contexts not used for this long, and rebuild any context older than the TTL
+CONTEXT_IDLE_SECONDS = float(os.getenv("SESSION_CONTEXT_IDLE_SECONDS", "1800"))
+CONTEXT_TTL_SECONDS = float(os.getenv("SESSION_CONTEXT_TTL_SECONDS", "21600"))
+# Cap on contexts per worker, by count and by approximate size of the text they hold
+CONTEXT_MAX_ENTRIES = int(os.getenv("SESSION_CONTEXT_MAX_ENTRIES", "5000"))
+CONTEXT_MAX_BYTES = int(os.getenv("SESSION_CONTEXT_MAX_BYTES", str(64 * 2**20)))
+
+# Rough per-context overhead (object, deque, dict slot) on top of the text itself
+CONTEXT_OVERHEAD_BYTES = 1024
+
+
+class SessionContext:
+    """
+    What post_message needs about a session between turns: the last few
+    messages, the running summary of everything before them, and counts.
+    `pending` holds messages that left the recent window but aren't in the
+    summary yet.
+    """
+
+    def __init__(self, session_id: str, user_id: int, dialect: str, summary, summarized_count: int,
+                 pending: list[str], recent: list[str]):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.dialect = dialect
+        self.summary = summary
+        self.summarized_count = summarized_count
+        self.pending = list(pending)
+        self.recent = deque(recent, maxlen=RECENT_MESSAGES)
+        self.created_at = self.last_used = time.monotonic()
+        self.size = (CONTEXT_OVERHEAD_BYTES + len(summary or "")
+                     + sum(len(m) for m in self.pending) + sum(len(m) for m in self.recent))
+
+    def append(self, message: str):
+        if len(self.recent) == self.recent.maxlen:
+            self.pending.append(self.recent[0])
+        self.size += len(message)
+        self.recent.append(message)
+
+    def fold(self, start: int, count: int, summary: str) -> bool:
+        """
+        Pending messages from `start` (a summarized_count snapshot) to
+        `start + count` are now covered by `summary`. Returns False, changing
+        nothing, if another turn folded in the meantime.
+        """
+        if start != self.summarized_count or count > len(self.pending):
+            return False
+        self.size -= sum(len(m) for m in self.pending[:count]) + len(self.summary or "")
+        del self.pending[:count]
+        self.summarized_count += count
+        self.summary = summary
+        self.size += len(summary)
+        return True
+
+
+class SessionContextCache:
+    """Per-worker LRU of SessionContext, bounded by entry count and memory"""
+
+    def __init__(self, max_entries: int = CONTEXT_MAX_ENTRIES, max_bytes: int = CONTEXT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._contexts = OrderedDict()
+        self._sizes = {}  # session_id -> size counted in total_bytes
+        self._generation = 0
+
+    def _expired(self, context: SessionContext, now: float) -> bool:
+        return (now - context.last_used > CONTEXT_IDLE_SECONDS
+                or now - context.created_at > CONTEXT_TTL_SECONDS)
+
+    def _drop(self, session_id: str):
+        self._contexts.pop(session_id, None)
+        self.total_bytes -= self._sizes.pop(session_id, 0)
+
+    def get(self, session_id):
+        session_id = str(session_id)
+        context = self._contexts.get(session_id)
+        if context is None:
+            return None
+        now = time.monotonic()
+        if self._expired(context, now):
+            self._drop(session_id)
+            return None
+        context.last_used = now
+        self._contexts.move_to_end(session_id)
+        return context
+
+    def set(self, context: SessionContext):
+        session_id = str(context.session_id)
+        self._drop(session_id)
+        self._contexts[session_id] = context
+        self._sizes[session_id] = context.size
+        self.total_bytes += context.size
+        self.trim()
+
+    def resized(self, context: SessionContext):
+        """Re-count a context after append/fold and enforce the caps"""
+        session_id = str(context.session_id)
+        if self._contexts.get(session_id) is not context:
+            return
+        self.total_bytes += context.size - self._sizes[session_id]
+        self._sizes[session_id] = context.size
+        self.trim()
+
+    def trim(self):
+        """Drop idle contexts, then least recently used ones until under both caps"""
+        now = time.monotonic()
+        while self._contexts:
+            session_id, oldest = next(iter(self._contexts.items()))
+            if not self._expired(oldest, now):
+                break
+            self._drop(session_id)
+        while self._contexts and (len(self._contexts) > self.max_entries or self.total_bytes > self.max_bytes):
+            self._drop(next(iter(self._contexts)))
+
+    def evict(self, session_id):
+        self._generation += 1
+        self._drop(str(session_id))
+
+    def clear(self):
+        self._generation += 1
+        self._contexts.clear()
+        self._sizes.clear()
+        self.total_bytes = 0
+
+    async def get_or_load(self, session_id, loader):
+        context = self.get(session_id)
+        if context is not None:
+            return context
+        generation = self._generation
+        context = await loader()
+        if bus.connected and generation == self._generation:
+            self.set(context)
+        return context
+
+
+session_contexts = bus.attach("session_context", SessionContextCache())
+
+
+async def load_session_context(db, session: dict) -> SessionContext:
+    """Build a context from Postgres; only runs on the first turn a worker sees for a session"""
+    rows = await db.fetch(
+        "SELECT sender, content FROM messages WHERE session_id=$1 ORDER BY created_at ASC",
+        session["id"]
+    )
+    if session["archived_at"] is not None:
+        rows = await load_archived_messages(db, session["id"]) + list(rows)
+    messages = [f"{r['sender']}: {r['content']}" for r in rows]
+
+    older = messages[:-RECENT_MESSAGES] if len(messages) > RECENT_MESSAGES else []
+    summarized_count = min(session.get("summarized_count") or 0, len(older))
+    return SessionContext(
+        session_id=str(session["id"]),
+        user_id=session["user_id"],
+        dialect=session["dialect"],
+        summary=session["summary"],
+        summarized_count=summarized_count,
+        pending=older[summarized_count:],
+        recent=messages[-RECENT_MESSAGES:],
+    )
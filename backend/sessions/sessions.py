@@ -1,55 +1,104 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
-from backend.core.utils import get_current_user, get_db
-from backend.references.sentence_parser import dictionary
-import os, json, requests
-import spacy
+from backend.core.utils import get_current_user, get_db, get_owned_session, get_user_settings_cached, get_user_facts_cached
+from backend.core.cache import bus, session_lists
+from backend.core.admission import BACKGROUND, INTERACTIVE, llm_slot, rate_limited_user
+from backend.core.resilience import HedgedLLM, LLMBackend, LLMUnavailable
+from starlette.concurrency import run_in_threadpool
+from backend.core.maintenance import load_archive_batches
+from backend.annotate.refresh import reannotate
+from backend.sessions.context import load_session_context, session_contexts
+from backend.core.responses import RecordResponse
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+from uuid import UUID
+from backend.references.sentence_parser import build_token_metadata, annotation_version
+from backend.references.self_disclosure import is_self_disclosure
+import os, json
 from google import genai
 
 client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
 SUMMARIZER_MODEL = "deepseek/deepseek-r1-distill-llama-70b:free"
 GEMINI_MODEL = "gemini-2.5-flash"
 
 router = APIRouter()
 
-@router.get("/", summary="List all chat sessions for the current user")
+# Summaries and fact extraction: the free primary model has very uneven latency,
+# so slow calls are hedged to a fallback model and failing backends are skipped
+auxiliary_llm = HedgedLLM(
+    primary=LLMBackend("openrouter", OPENROUTER_URL, SUMMARIZER_MODEL, "OPENROUTER_API_KEY"),
+    secondary=LLMBackend(
+        "fallback",
+        os.getenv("LLM_FALLBACK_URL", OPENROUTER_URL),
+        os.getenv("LLM_FALLBACK_MODEL", "meta-llama/llama-3.3-70b-instruct:free"),
+        os.getenv("LLM_FALLBACK_API_KEY_ENV", "OPENROUTER_API_KEY"),
+    ),
+)
+
+# Response models are used for the OpenAPI schema only; routes return a
+# RecordResponse so rows are serialized straight from asyncpg without validation.
+class SessionOut(BaseModel):
+    id: UUID
+    dialect: str
+    summary: Optional[str] = None
+    session_name: str
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+class TokenOut(BaseModel):
+    index: int
+    blurb: str
+    word: str
+
+class MessageOut(BaseModel):
+    id: int
+    sender: str
+    content: str
+    token_metadata: Optional[list[TokenOut]] = None
+    created_at: datetime
+
+class ReplyOut(BaseModel):
+    reply: str
+    session_id: str
+
+class PostMessageOut(BaseModel):
+    llm: ReplyOut
+    tokens: list[TokenOut]
+
+@router.get("/", summary="List all chat sessions for the current user", response_model=list[SessionOut])
 async def list_sessions(
     request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     db = get_db(request)
-    rows = await db.fetch(
-        """
-        SELECT id, dialect, summary, session_name, created_at, updated_at
-        FROM sessions
-        WHERE user_id = $1
-        ORDER BY updated_at DESC
-        """,
-        current_user["id"],
-    )
-    return [dict(r) for r in rows]
 
-@router.get("/{session_id}", summary="Get one chat session by ID")
+    async def load():
+        rows = await db.fetch(
+            """
+            SELECT id, dialect, summary, session_name, created_at, updated_at
+            FROM sessions
+            WHERE user_id = $1
+            ORDER BY updated_at DESC
+            """,
+            current_user["id"],
+        )
+        return [dict(r) for r in rows]
+
+    return RecordResponse(await session_lists.get_or_load(current_user["id"], load))
+
+@router.get("/{session_id}", summary="Get one chat session by ID", response_model=SessionOut)
 async def get_session(
     session_id: str,
     request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     db = get_db(request)
-    row = await db.fetchrow(
-        """
-        SELECT id, dialect, summary, session_name, created_at, updated_at
-        FROM sessions
-        WHERE id = $1 AND user_id = $2
-        """,
-        session_id, current_user["id"]
-    )
-
-    if not row:
-        raise HTTPException(status_code=404, detail="Session not found")
+    session = await get_owned_session(db, session_id, current_user["id"])
 
-    return dict(row)
+    return RecordResponse({field: session[field] for field in SessionOut.model_fields})
 
-@router.get("/{session_id}/messages", summary="Get all messages for a session")
+@router.get("/{session_id}/messages", summary="Get all messages for a session", response_model=list[MessageOut])
 async def get_session_messages(
     session_id: str,
     request: Request,
@@ -58,117 +107,60 @@ async def get_session_messages(
     db = get_db(request)
 
     # Check that session belongs to user
-    session = await db.fetchrow(
-        """
-        SELECT id FROM sessions
-        WHERE id = $1 AND user_id = $2
-        """,
-        session_id, current_user["id"]
-    )
+    session = await get_owned_session(db, session_id, current_user["id"])
 
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
+    # Older messages may have been moved to cold storage
+    batches = []
+    if session["archived_at"] is not None:
+        batches = [
+            (archive_id, session["dialect"], messages)
+            for archive_id, messages in await load_archive_batches(db, session_id)
+        ]
 
     # Fetch messages for the session
     rows = await db.fetch(
         """
-        SELECT id, sender, content, token_metadata, created_at
+        SELECT id, sender, content, token_metadata, token_metadata_version, created_at
         FROM messages
         WHERE session_id = $1
         ORDER BY created_at ASC
         """,
         session_id
     )
+    hot = [dict(r, dialect=session["dialect"]) for r in rows]
+    messages = [m for _, _, batch in batches for m in batch] + hot
 
-    return [dict(r) for r in rows]
-
-# Helper: summarize old history
-async def summarize_history(messages: list[str]) -> str:
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
-        headers={"Authorization": f"Bearer {os.environ['OPENROUTER_API_KEY']}"},
-        data=json.dumps({
-            "model": SUMMARIZER_MODEL,
-            "messages": [{
-                "role": "user",
-                "content": f"Summarize conversation below. Remove articles (a/an/the), use contractions (can't/won't), possessives (user's/AI's), abbreviations. Be ultra-concise:\n\n" + "\n".join(messages)
-            }]
-        })
-    )
-    response.raise_for_status()
-    return response.json()["choices"][0]["message"]["content"]
-
-nlp = spacy.load("es_core_news_sm")
+    # Blurbs from an older dictionary/glossary/model are redone on first read
+    annotated = {m["id"] for m in messages if m["token_metadata"] is not None}
+    await reannotate(db, annotation_version(), hot, batches, only=annotated)
 
-GLOSSARY_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "slang_glossary.json")
-with open(GLOSSARY_PATH, "r", encoding="utf-8") as f:
-    SLANG_GLOSSARY = json.load(f)
+    return RecordResponse([{field: m[field] for field in MessageOut.model_fields} for m in messages])
 
-
-def build_token_metadata(text: str):
-    """
-    Parse text tokens and return metadata for each token including position and blurb
-    """
+# Helper: summarize old history
+async def summarize_history(messages: list[str]) -> Optional[str]:
+    """Returns None if no model answered in time; the turn goes ahead without a summary"""
     try:
-        token_data = dictionary(text)  # Returns [(index, blurb), ...]
-        
-        # Convert to more structured format for frontend consumption
-        tokens = []
-        for idx, blurb in token_data:
-            # Only include tokens that have meaningful content (not just punctuation or whitespace)
-            # Find the actual word at this position
-            if idx < len(text):
-                # Look for the word boundary
-                word_start = idx
-                word_end = idx
-                
-                # Move to start of word if we're in the middle
-                while word_start > 0 and text[word_start - 1].isalnum():
-                    word_start -= 1
-                    
-                # Find end of word
-                while word_end < len(text) and text[word_end].isalnum():
-                    word_end += 1
-                
-                # Only add if it's a real word (not just punctuation)
-                if word_end > word_start and any(c.isalpha() for c in text[word_start:word_end]):
-                    tokens.append({
-                        "index": word_start,
-                        "blurb": blurb,
-                        "word": text[word_start:word_end]
-                    })
-        
-        return tokens
-    except Exception as e:
-        print(f"Error parsing tokens: {e}")
-        return []
+        return await auxiliary_llm.complete(
+            f"Summarize conversation below. Remove articles (a/an/the), use contractions (can't/won't), possessives (user's/AI's), abbreviations. Be ultra-concise:\n\n" + "\n".join(messages),
+            INTERACTIVE,
+        )
+    except LLMUnavailable as e:
+        print(f"Skipping summary: {e}")
+        return None
 
-async def extract_learner_facts(user_message: str, bot_response: str, existing_facts: dict, message_count: int = 0) -> dict:
+async def extract_learner_facts(user_message: str, bot_response: str, existing_facts: dict) -> dict:
     """
     Extract new learner facts from conversation to update user profile.
     Returns updated facts dictionary.
-    Only extracts facts periodically to avoid excessive API calls.
+    Only calls the LLM when the user message looks like it says something about the learner.
     """
     try:
-        # Ensure existing_facts is a dictionary
-        if isinstance(existing_facts, str):
-            try:
-                existing_facts = json.loads(existing_facts)
-            except json.JSONDecodeError:
-                existing_facts = {}
-        elif existing_facts is None:
+        # facts is JSONB, decoded by the pool codec; only guard against NULL or non-objects
+        if not isinstance(existing_facts, dict):
             existing_facts = {}
-        elif not isinstance(existing_facts, dict):
-            existing_facts = {}
-        
-        # Only extract facts every few messages or if it's early in the conversation
-        should_extract = (
-            message_count <= 6 or  # First few messages
-            message_count % 8 == 0 or  # Every 8th message after that
-            len(existing_facts) < 3  # If we don't have many facts yet
-        )
-        
-        if not should_extract:
+
+        # Skip turns like "jaja sí" that can't contain new facts
+        if not is_self_disclosure(user_message):
             return existing_facts
         
         fact_extraction_prompt = """You are a language learning assistant. Analyze this conversation and extract useful facts about the learner that would help personalize future conversations.
@@ -199,24 +191,12 @@ Example format (but don't limit yourself to these categories):
             bot_response
         )
 
-        # Use OpenRouter instead of Gemini for cost savings
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers={"Authorization": f"Bearer {os.environ['OPENROUTER_API_KEY']}"},
-            data=json.dumps({
-                "model": SUMMARIZER_MODEL,  # Reuse the same cost-effective model
-                "messages": [{
-                    "role": "user",
-                    "content": fact_extraction_prompt
-                }]
-            })
-        )
-        response.raise_for_status()
+        # Use OpenRouter instead of Gemini for cost savings. Background priority:
+        # when upstream capacity is short this is shed and the old facts are kept.
+        fact_response_text = await auxiliary_llm.complete(fact_extraction_prompt, BACKGROUND)
         
         # Parse the JSON response
         try:
-            fact_response_text = response.json()["choices"][0]["message"]["content"]
-            
             # Clean up the response - remove markdown code blocks if present
             cleaned_text = fact_response_text.strip()
             if cleaned_text.startswith("```json"):
@@ -250,44 +230,55 @@ Example format (but don't limit yourself to these categories):
         return existing_facts
 
 # Route: send new message
-@router.post("/{session_id}/messages", summary="Send a new message in a session")
+@router.post("/{session_id}/messages", summary="Send a new message in a session", response_model=PostMessageOut)
 async def post_message(
     session_id: str,
     request: Request,
     payload: dict,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(rate_limited_user)
 ):
     db = get_db(request)
     user_message = payload.get("message")
     if not user_message:
         raise HTTPException(status_code=400, detail="Message text required")
 
-    # Check session belongs to user
-    session = await db.fetchrow(
-        "SELECT id, dialect FROM sessions WHERE id=$1 AND user_id=$2",
-        session_id, current_user["id"]
-    )
-    if not session:
+    # Hot path: the worker already holds this session's context, including its owner
+    context = session_contexts.get(session_id)
+    if context is None:
+        session = await get_owned_session(db, session_id, current_user["id"])
+        context = await session_contexts.get_or_load(session_id, lambda: load_session_context(db, session))
+    elif context.user_id != current_user["id"]:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    # Fetch user profile
-    user = await db.fetchrow(
-        "SELECT dialect, experience_level, facts FROM users WHERE id=$1",
-        current_user["id"]
-    )
-
-    # Fetch all past messages
-    rows = await db.fetch(
-        "SELECT sender, content FROM messages WHERE session_id=$1 ORDER BY created_at ASC",
-        session_id
-    )
-    all_messages = [f"{r['sender']}: {r['content']}" for r in rows]
+    # Fetch user profile (served from the invalidated user caches)
+    settings = await get_user_settings_cached(db, current_user["id"])
+    user = {
+        "dialect": settings["dialect"],
+        "experience_level": settings["experience_level"],
+        "facts": await get_user_facts_cached(db, current_user["id"]),
+    }
 
-    # Summarize older history if needed
-    summary = None
-    if len(all_messages) > 5:
-        summary = await summarize_history(all_messages[:-5])
-    recent_messages = all_messages[-5:]
+    # Fold messages that left the recent window into the running summary
+    # (a concurrent turn on the same session may fold first; then this summary is dropped)
+    if context.pending:
+        start, folding = context.summarized_count, list(context.pending)
+        earlier = [f"Earlier summary: {context.summary}"] if context.summary else []
+        new_summary = await summarize_history(earlier + folding)
+        if new_summary is not None and context.summarized_count == start:
+            # Saved before the model call, so a failed turn can't leave it only in memory
+            await db.execute(
+                """
+                UPDATE sessions
+                SET summary = CASE WHEN summarized_count <= $3 THEN $2 ELSE summary END,
+                    summarized_count = GREATEST(summarized_count, $3)
+                WHERE id = $1
+                """,
+                session_id, new_summary, start + len(folding)
+            )
+            await bus.notify(db, "session", session_id)
+            context.fold(start, len(folding), new_summary)
+    summary = context.summary
+    recent_messages = list(context.recent)
 
     # Build Gemini prompt
     summary_section = f"\n\nConversation Summary: {summary}" if summary else ""
@@ -319,44 +310,59 @@ Respond naturally as Andrés would in a text conversation."""
     
     # Send the complete conversation as a single message
     full_prompt = "\n".join(conversation_history)
-    response = chat.send_message(full_prompt)
+    async with llm_slot(INTERACTIVE):
+        response = await run_in_threadpool(chat.send_message, full_prompt)
 
     # Parse tokens for bot message
-    token_metadata = build_token_metadata(response.text)
+    token_metadata = build_token_metadata(response.text, context.dialect)
 
-    # Extract and update learner facts (pass message count for optimization)
-    message_count = len(all_messages)
-    # Ensure facts is properly handled as a dict
-    current_facts = user['facts'] if user['facts'] is not None else {}
-    updated_facts = await extract_learner_facts(user_message, response.text, current_facts, message_count)
+    # Extract and update learner facts
+    current_facts = user['facts']
+    updated_facts = await extract_learner_facts(user_message, response.text, current_facts)
     
     # Update user facts in database if they changed
     if updated_facts != current_facts:
         await db.execute(
             "UPDATE users SET facts = $1 WHERE id = $2",
-            json.dumps(updated_facts), current_user["id"]
+            updated_facts, current_user["id"]
         )
+        await bus.notify(db, "user_facts", current_user["id"])
         print(f"Facts updated for user {current_user['id']}: {updated_facts}")
 
-    # Save messages into DB
+    # Save messages into DB; clock_timestamp() keeps the pair ordered by created_at
     await db.execute(
-        "INSERT INTO messages (session_id, sender, content) VALUES ($1, $2, $3)",
-        session_id, "user", user_message
+        """
+        INSERT INTO messages (session_id, sender, content, token_metadata, token_metadata_version, created_at)
+        VALUES ($1, 'user', $2, NULL, NULL, clock_timestamp()),
+               ($1, 'bot', $3, $4, $5, clock_timestamp())
+        """,
+        session_id, user_message, response.text, token_metadata, annotation_version()
     )
+    context.append(f"user: {user_message}")
+    context.append(f"bot: {response.text}")
+    session_contexts.resized(context)
+
+    # Keep updated_at current so maintenance doesn't archive active sessions
     await db.execute(
-        "INSERT INTO messages (session_id, sender, content, token_metadata) VALUES ($1, $2, $3, $4)",
-        session_id, "bot", response.text, json.dumps(token_metadata)
+        "UPDATE sessions SET updated_at = NOW() WHERE id = $1",
+        session_id
     )
-
-    return {
+    # This worker's context is already up to date; other workers rebuild theirs
+    await bus.notify_many(db, [
+        ("session", session_id, False),
+        ("session_list", current_user["id"], False),
+        ("session_context", session_id, True),
+    ])
+
+    return RecordResponse({
         "llm": {
             "reply": response.text,
             "session_id": session_id
         },
         "tokens": token_metadata
-    }
+    })
 
-@router.post("/", summary="Create a new chat session")
+@router.post("/", summary="Create a new chat session", response_model=SessionOut)
 async def create_session(
     request: Request,
     payload: dict,
@@ -375,9 +381,10 @@ async def create_session(
         payload.get("summary", None),
         "unnamed",  # Default session name
     )
-    return dict(row)
+    await bus.notify(db, "session_list", current_user["id"])
+    return RecordResponse(row)
 
-@router.put("/{session_id}", summary="Update session name")
+@router.put("/{session_id}", summary="Update session name", response_model=SessionOut)
 async def update_session(
     session_id: str,
     request: Request,
@@ -387,13 +394,8 @@ async def update_session(
     db = get_db(request)
     
     # Check that session belongs to user
-    session = await db.fetchrow(
-        "SELECT id FROM sessions WHERE id=$1 AND user_id=$2",
-        session_id, current_user["id"]
-    )
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-    
+    await get_owned_session(db, session_id, current_user["id"])
+
     # Update session name
     row = await db.fetchrow(
         """
@@ -406,8 +408,10 @@ async def update_session(
         session_id,
         current_user["id"]
     )
-    
-    return dict(row)
+    await bus.notify(db, "session", session_id)
+    await bus.notify(db, "session_list", current_user["id"])
+
+    return RecordResponse(row)
 
 @router.delete("/{session_id}", summary="Delete a session")
 async def delete_session(
@@ -416,25 +420,18 @@ async def delete_session(
     current_user: dict = Depends(get_current_user)
 ):
     db = get_db(request)
-    
-    # Check that session belongs to user
-    session = await db.fetchrow(
-        "SELECT id FROM sessions WHERE id=$1 AND user_id=$2",
+
+    # Messages and archives go with it via ON DELETE CASCADE
+    deleted = await db.fetchval(
+        "DELETE FROM sessions WHERE id = $1 AND user_id = $2 RETURNING id",
         session_id, current_user["id"]
     )
-    if not session:
+    if not deleted:
         raise HTTPException(status_code=404, detail="Session not found")
-    
-    # Delete messages first (foreign key constraint)
-    await db.execute(
-        "DELETE FROM messages WHERE session_id = $1",
-        session_id
-    )
-    
-    # Delete session
-    await db.execute(
-        "DELETE FROM sessions WHERE id = $1 AND user_id = $2",
-        session_id, current_user["id"]
-    )
-    
+    await bus.notify_many(db, [
+        ("session", session_id, False),
+        ("session_list", current_user["id"], False),
+        ("session_context", session_id, False),
+    ])
+
     return {"message": "Session deleted successfully"}
@@ -0,0 +1,135 @@
+"""
+Multi-process check of the LISTEN/NOTIFY cache invalidation bus: a write
+announced by one worker must evict the entry in every other worker.
+
+Needs a reachable Postgres in DATABASE_URL (or CACHE_LISTEN_URL):
+    DATABASE_URL=postgresql://... python -m pytest backend/tests
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+import pytest
+
+DSN = os.getenv("CACHE_LISTEN_URL") or os.getenv("DATABASE_URL")
+WORKERS = 3
+TIMEOUT = 10
+
+pytestmark = pytest.mark.skipif(not DSN, reason="DATABASE_URL is not set")
+
+
+def _worker(dsn, commands, results):
+    asyncio.run(_serve(dsn, commands, results))
+
+
+async def _serve(dsn, commands, results):
+    import asyncpg
+    from backend.core.cache import bus, user_settings
+
+    await bus.start(dsn)
+    deadline = time.monotonic() + TIMEOUT
+    while not bus.connected and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    conn = await asyncpg.connect(dsn)
+    results.put(("ready", bus.connected))
+
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            # Block in a thread so the LISTEN connection keeps processing notifications
+            command, key, arg = await loop.run_in_executor(None, commands.get)
+            if command == "set":
+                user_settings.set(key, arg)
+                results.put(("set", True))
+            elif command == "get":
+                results.put(("get", user_settings.get(key)))
+            elif command == "notify":
+                await bus.notify(conn, "user_settings", key, keep_local=arg)
+                results.put(("notify", True))
+            elif command == "stop":
+                break
+    finally:
+        await conn.close()
+        await bus.stop()
+
+
+class Worker:
+    def __init__(self, ctx):
+        self.commands = ctx.Queue()
+        self.results = ctx.Queue()
+        self.process = ctx.Process(target=_worker, args=(DSN, self.commands, self.results), daemon=True)
+        self.process.start()
+
+    def call(self, command, key=None, arg=None):
+        self.commands.put((command, key, arg))
+        kind, value = self.results.get(timeout=TIMEOUT)
+        assert kind == command
+        return value
+
+    def wait_evicted(self, key) -> bool:
+        deadline = time.monotonic() + TIMEOUT
+        while time.monotonic() < deadline:
+            if self.call("get", key) is None:
+                return True
+            time.sleep(0.05)
+        return False
+
+    def stop(self):
+        self.commands.put(("stop", None, None))
+        self.process.join(TIMEOUT)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+@pytest.fixture
+def workers():
+    # spawn: each worker gets its own event loop, bus and caches, like uvicorn workers
+    ctx = multiprocessing.get_context("spawn")
+    started = [Worker(ctx) for _ in range(WORKERS)]
+    try:
+        for w in started:
+            kind, connected = w.results.get(timeout=TIMEOUT * 3)
+            assert kind == "ready" and connected, "worker could not LISTEN"
+        yield started
+    finally:
+        for w in started:
+            w.stop()
+
+
+def test_write_on_one_worker_evicts_everywhere(workers):
+    key = f"test-{os.getpid()}-{time.monotonic_ns()}"
+    for w in workers:
+        w.call("set", key, {"dialect": "mx"})
+        assert w.call("get", key) == {"dialect": "mx"}
+
+    workers[0].call("notify", key, False)
+
+    for w in workers:
+        assert w.wait_evicted(key)
+
+
+def test_keep_local_only_evicts_other_workers(workers):
+    key = f"test-{os.getpid()}-{time.monotonic_ns()}"
+    for w in workers:
+        w.call("set", key, {"dialect": "mx"})
+
+    workers[0].call("notify", key, True)
+
+    for w in workers[1:]:
+        assert w.wait_evicted(key)
+    # Its own notification has arrived by now too, and was ignored
+    assert workers[0].call("get", key) == {"dialect": "mx"}
+
+
+def test_other_keys_are_untouched(workers):
+    key = f"test-{os.getpid()}-{time.monotonic_ns()}"
+    other = key + "-other"
+    for w in workers:
+        w.call("set", key, 1)
+        w.call("set", other, 2)
+
+    workers[0].call("notify", key, False)
+
+    for w in workers:
+        assert w.wait_evicted(key)
+        assert w.call("get", other) == 2
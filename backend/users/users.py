@@ -2,7 +2,9 @@ from fastapi import APIRouter, HTTPException, Depends, Request
 from pydantic import BaseModel
 from typing import Optional
 import asyncpg
-import json
+from backend.core.responses import RecordResponse
+from backend.core.cache import bus, user_ids
+from backend.core.utils import get_user_settings_cached, get_user_facts_cached
 
 router = APIRouter()
 
@@ -35,6 +37,9 @@ class UserSettings(BaseModel):
 class UserFactsUpdate(BaseModel):
     facts: dict
 
+class UserFacts(BaseModel):
+    facts: dict
+
 async def get_user_id_from_token(request: Request):
     """Extract user ID from Authorization header"""
     auth_header = request.headers.get("authorization")
@@ -51,18 +56,15 @@ async def get_user_settings(request: Request):
     
     async with request.app.state.db.acquire() as conn:
         # Ensure user exists
-        await ensure_user(conn, auth0_id)
+        user_id = await user_ids.get_or_load(auth0_id, lambda: ensure_user(conn, auth0_id))
         
         # Get user data
-        row = await conn.fetchrow(
-            "SELECT id, auth0_id, email, display_name, dialect, experience_level FROM users WHERE auth0_id=$1",
-            auth0_id
-        )
+        row = await get_user_settings_cached(conn, user_id)
         
         if not row:
             raise HTTPException(status_code=404, detail="User not found")
         
-        return UserSettings(**dict(row))
+        return RecordResponse(row)
 
 @router.put("/me", response_model=UserSettings)
 async def update_user_settings(settings: UserSettingsUpdate, request: Request):
@@ -71,7 +73,7 @@ async def update_user_settings(settings: UserSettingsUpdate, request: Request):
     
     async with request.app.state.db.acquire() as conn:
         # Ensure user exists
-        await ensure_user(conn, auth0_id)
+        user_id = await user_ids.get_or_load(auth0_id, lambda: ensure_user(conn, auth0_id))
         
         # Build dynamic update query
         update_fields = []
@@ -115,45 +117,41 @@ async def update_user_settings(settings: UserSettingsUpdate, request: Request):
         
         if not row:
             raise HTTPException(status_code=404, detail="User not found")
+        await bus.notify(conn, "user_settings", user_id)
             
-        return UserSettings(**dict(row))
+        return RecordResponse(row)
 
-@router.get("/me/facts")
+@router.get("/me/facts", response_model=UserFacts)
 async def get_user_facts(request: Request):
     """Get current user's learned facts"""
     auth0_id = await get_user_id_from_token(request)
     
     async with request.app.state.db.acquire() as conn:
         # Ensure user exists
-        await ensure_user(conn, auth0_id)
+        user_id = await user_ids.get_or_load(auth0_id, lambda: ensure_user(conn, auth0_id))
         
         # Get user facts
-        row = await conn.fetchrow(
-            "SELECT facts FROM users WHERE auth0_id=$1",
-            auth0_id
-        )
-        
-        if not row:
-            raise HTTPException(status_code=404, detail="User not found")
+        facts = await get_user_facts_cached(conn, user_id)
         
-        return {"facts": row["facts"] or {}}
+        return RecordResponse({"facts": facts})
 
-@router.put("/me/facts")
+@router.put("/me/facts", response_model=UserFacts)
 async def update_user_facts(facts_update: UserFactsUpdate, request: Request):
     """Update current user's learned facts (for debugging/manual management)"""
     auth0_id = await get_user_id_from_token(request)
     
     async with request.app.state.db.acquire() as conn:
         # Ensure user exists
-        await ensure_user(conn, auth0_id)
+        user_id = await user_ids.get_or_load(auth0_id, lambda: ensure_user(conn, auth0_id))
         
         # Update facts
         row = await conn.fetchrow(
             "UPDATE users SET facts = $1 WHERE auth0_id = $2 RETURNING facts",
-            json.dumps(facts_update.facts), auth0_id
+            facts_update.facts, auth0_id
         )
         
         if not row:
             raise HTTPException(status_code=404, detail="User not found")
+        await bus.notify(conn, "user_facts", user_id)
             
-        return {"facts": row["facts"]}
\ No newline at end of file
+        return RecordResponse({"facts": row["facts"]})
\ No newline at end of file